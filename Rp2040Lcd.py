@@ -7,8 +7,9 @@ import framebuf
 from utime import sleep, ticks_ms
 from micropython import const
 from math import sin, cos, radians, sqrt
-from lxEuclidConfig import LxEuclidConstant
+from lxEuclidConfig import LxEuclidConstant, PATTERN_SLOT_BEATS, PATTERN_SLOT_ROTATED_LOW, PATTERN_SLOT_ROTATED_HIGH
 from cvManager import CvChannel
+from rhythmPatterns import get_pattern_step
 
 DC = const(8)
 CS = const(9)
@@ -23,6 +24,10 @@ DEBUG = False
 LX_LOGO = const("helixbyte_r5g6b5.bin")
 PARAM = const("param.bin")
 
+# indexed by the cv calibration step of test mode
+CV_CALIBRATION_TXT = ["tap: all cv 0V", "tap: all cv 5V",
+                      "cv cal saved", "cv cal error"]
+
 
 def rgb888_to_rgb565(R: int, G: int, B: int):  # Convert RGB888 to RGB565
     return const((((G & 0b00011100) << 3) + ((B & 0b11111000) >> 3) << 8) + (R & 0b11111000)+((G & 0b11100000) >> 5))
@@ -556,6 +561,10 @@ class LCD_1inch28(framebuf.FrameBuffer):
             self.font_writer_freesans20.text(txt, 80, 140, self.white)
             txt = f"cv4:{cv_v_values[3]}V"
             self.font_writer_freesans20.text(txt, 80, 160, self.white)
+            txt = CV_CALIBRATION_TXT[self.lx_euclid_config.cv_calibration_step]
+            txt_len = self.font_writer_freesans20.stringlen(txt)
+            self.font_writer_freesans20.text(
+                txt, 120-(txt_len//2), 185, self.white)
 
         if local_state == LxEuclidConstant.STATE_LIVE:
             self.display_rhythm_circles()
@@ -877,6 +886,10 @@ class LCD_1inch28(framebuf.FrameBuffer):
                     self.font_writer_font6.text("save", 106, 130, page_color)
                     num_color = txt_color
 
+                # outer circle changes the bank
+                self.font_writer_font6.text(
+                    "bank " + str(self.lx_euclid_config.preset_bank_index+1), 102, 142, page_color)
+
                 texts = [["1"], ["2"], ["3"], ["4"],
                          ["5"], ["6"], ["7"], ["8"]]
 
@@ -1095,20 +1108,17 @@ class LCD_1inch28(framebuf.FrameBuffer):
                 else:
                     local_current_step = euclidieanRhythm.current_step
 
-            local_offset = euclidieanRhythm.offset
-            if euclidieanRhythm.has_cv_offset:
-                local_offset = euclidieanRhythm.global_cv_offset
-
-            local_rhythm = euclidieanRhythm.rhythm.copy()
-
-            len_euclidiean_rhythm = len(local_rhythm)
+            # same rotated pattern as the one used by the clock interrupt, the slot is read
+            # once so the pattern can't change while it's drawn
+            local_patterns = euclidieanRhythm.patterns
+            local_active_pattern = euclidieanRhythm.active_pattern
+            local_pattern_low = local_patterns[local_active_pattern +
+                                               PATTERN_SLOT_ROTATED_LOW]
+            local_pattern_high = local_patterns[local_active_pattern +
+                                                PATTERN_SLOT_ROTATED_HIGH]
 
-            # in the case of an empty rhythm (probably because of multi-threading)
-            # we put a simple rhythm of 1... it's not optimal can cause visual glitch
-            # but this solution saves times and help us stay real-time with rhythm
-            if len_euclidiean_rhythm == 0:
-                len_euclidiean_rhythm = 1
-                local_rhythm = [0]
+            len_euclidiean_rhythm = local_patterns[local_active_pattern +
+                                                   PATTERN_SLOT_BEATS]
 
             degree_step = 360/len_euclidiean_rhythm
 
@@ -1133,8 +1143,8 @@ class LCD_1inch28(framebuf.FrameBuffer):
                                 120, 10, highlight_color, True)
                     final_beat_color = beat_color_hightlight
 
-                filled = local_rhythm[(
-                    index-local_offset) % len_euclidiean_rhythm]
+                filled = get_pattern_step(
+                    local_pattern_low, local_pattern_high, index)
 
                 self.circle(coord[0]+120, coord[1]+120,
                             8, final_beat_color, filled)
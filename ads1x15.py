@@ -156,6 +156,31 @@ class ADS1115:
                      _MODE_SINGLE | _OS_SINGLE | _GAINS[self.gain] |
                      _CHANNELS[(channel1, channel2)])
 
+    def set_conversion_ready_mode(self):
+        """Use the ALERT/RDY pin as a conversion ready signal:
+           Hi_thresh MSB to 1 and Lo_thresh MSB to 0."""
+        return (self._write_register(_REGISTER_HITHRESH, 0x8000) and
+                self._write_register(_REGISTER_LOWTHRESH, 0x0000))
+
+    def start_conversion(self, rate=4, channel1=0, channel2=None):
+        """Start a single conversion, ALERT/RDY pin goes low once done
+           if set_conversion_ready_mode was called."""
+        return self._write_register(_REGISTER_CONFIG, (_CQUE_1CONV | _CLAT_NONLAT |
+                                                       _CPOL_ACTVLOW | _CMODE_TRAD | _RATES[rate] |
+                                                       _MODE_SINGLE | _OS_SINGLE | _GAINS[self.gain] |
+                                                       _CHANNELS[(channel1, channel2)]))
+
+    def is_conversion_done(self):
+        config_register = self._read_register(_REGISTER_CONFIG)
+        return config_register is not None and config_register & _OS_NOTBUSY
+
+    def read_conversion(self):
+        """Read the last conversion result, None if the read failed."""
+        res = self._read_register(_REGISTER_CONVERT)
+        if res is not None:
+            return res if res < 32768 else res - 65536
+        return None
+
     def read_non_blocking(self, rate=4, channel1=0, channel2=None):
         """Read voltage between a channel and GND.
            Time depends on conversion rate."""
@@ -0,0 +1,241 @@
+from array import array
+from micropython import const
+from utime import ticks_ms
+
+# T24C64 page size, a write of up to one page costs one write cycle
+EEPROM_PAGE_SIZE = const(32)
+
+# a commit is written one eeprom page at a time, each commit_step stops before a page that could
+# exceed this number of written bytes or once this time is spent. At least one page is processed
+# per step so a commit always progresses
+COMMIT_STEP_BUDGET_BYTES = const(64)
+COMMIT_STEP_BUDGET_MS = const(10)
+
+# commit_position when no commit is running
+COMMIT_IDLE = const(-1)
+
+# the config is journaled in slots written in turn so each save wears another part of the
+# eeprom. A slot is a header then the config image, the header is written last and holds the
+# crc of the image so a slot interrupted by a power off is never loaded
+JOURNAL_SLOT_SIZE = const(384)  # 12 eeprom pages
+JOURNAL_SLOTS = const(15)  # 5760 bytes, followed by the preset bank then the cv calibration
+JOURNAL_END_E_ADDR = const(5760)
+JOURNAL_HEADER_SIZE = const(8)
+# biggest image a slot can hold, records of older config layouts can have another size
+JOURNAL_IMAGE_MAX_SIZE = const(376)
+JOURNAL_MAGIC = const(0x4C)
+
+# header: magic, sequence (16 bits), image size (16 bits), crc (16 bits), unused
+JOURNAL_HEADER_MAGIC = const(0)
+JOURNAL_HEADER_SEQUENCE = const(1)
+JOURNAL_HEADER_SIZE_FIELD = const(3)
+JOURNAL_HEADER_CRC = const(5)
+
+# before the journal the config was a single image at the address 0, where the slot 0 is
+LEGACY_CONFIG_E_ADDR = const(0)
+
+
+def build_crc16_table():
+    table = array("H", bytearray(256*2))
+    for byte in range(0, 256):
+        crc = byte << 8
+        for _ in range(0, 8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table[byte] = crc
+    return table
+
+
+CRC16_TABLE = build_crc16_table()
+
+
+CRC16_INIT = const(0xFFFF)
+
+
+# crc16 ccitt (0x1021) of data[start:end] continued from crc, start from CRC16_INIT
+def crc16_update(crc, data, start, end):
+    table = CRC16_TABLE
+    for index in range(start, end):
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ data[index]]
+    return crc
+
+
+# true if the 16 bits sequence a is after b, sequences wrap around
+def is_sequence_after(a, b):
+    return a != b and ((a - b) & 0xFFFF) < 0x8000
+
+
+class ConfigJournal:
+
+    def __init__(self, lx_hardware, image_size):
+        self.lx_hardware = lx_hardware
+        self.image_size = image_size
+
+        # slot and sequence of the last committed record
+        self.slot = 0
+        self.sequence = 0
+        # size of the image filled by load
+        self.loaded_size = 0
+
+        # content of the last committed record and previous content of the slot being written.
+        # saved_image is not valid until a record of image_size is loaded or committed
+        self.saved_image = bytearray(image_size)
+        self.saved_image_valid = False
+        self.slot_image = bytearray(image_size)
+        self.header = bytearray(JOURNAL_HEADER_SIZE)
+
+        # image of the running commit, it must not change until the commit is done
+        self.commit_image = bytearray(image_size)
+        # next image index to write, the slot and the crc of the written part of the commit
+        self.commit_position = COMMIT_IDLE
+        self.commit_slot = 0
+        self.commit_crc = CRC16_INIT
+        self.commit_start_ms = 0
+
+        # duration (including the time between the steps) and number of eeprom page writes of
+        # the last commit
+        self.last_save_duration_ms = 0
+        self.last_save_writes = 0
+
+    def __slot_addr(self, slot):
+        return slot * JOURNAL_SLOT_SIZE
+
+    # fill image (JOURNAL_IMAGE_MAX_SIZE bytes) with the newest valid record of the scan_slots
+    # first slots and set loaded_size, return False if there is none and image holds the legacy
+    # config. Older memory versions can have more slots than JOURNAL_SLOTS, where the preset bank
+    # is now. Reads at most every header and every image once
+    def load(self, image, scan_slots=JOURNAL_SLOTS):
+        sequences = array("H", bytearray(scan_slots*2))
+        valid_slots = 0
+        for slot in range(0, scan_slots):
+            header = self.lx_hardware.get_eeprom_data(
+                self.__slot_addr(slot), JOURNAL_HEADER_SIZE)
+            record_size = self.__read_u16(header, JOURNAL_HEADER_SIZE_FIELD)
+            if header[JOURNAL_HEADER_MAGIC] == JOURNAL_MAGIC and record_size > 0 and record_size <= JOURNAL_IMAGE_MAX_SIZE:
+                sequences[slot] = self.__read_u16(
+                    header, JOURNAL_HEADER_SEQUENCE)
+                valid_slots |= 1 << slot
+
+        while valid_slots:
+            newest_slot = -1
+            for slot in range(0, scan_slots):
+                if valid_slots & (1 << slot):
+                    if newest_slot == -1 or is_sequence_after(sequences[slot], sequences[newest_slot]):
+                        newest_slot = slot
+            valid_slots &= ~(1 << newest_slot)
+
+            slot_addr = self.__slot_addr(newest_slot)
+            header = self.lx_hardware.get_eeprom_data(
+                slot_addr, JOURNAL_HEADER_SIZE)
+            record_size = self.__read_u16(header, JOURNAL_HEADER_SIZE_FIELD)
+            memoryview(image)[0:record_size] = self.lx_hardware.get_eeprom_data(
+                slot_addr+JOURNAL_HEADER_SIZE, record_size)
+            if crc16_update(CRC16_INIT, image, 0, record_size) == self.__read_u16(header, JOURNAL_HEADER_CRC):
+                self.slot = newest_slot
+                self.sequence = sequences[newest_slot]
+                self.loaded_size = record_size
+                # a record of another size is an older config layout, it will be rewritten
+                self.saved_image_valid = record_size == self.image_size
+                if self.saved_image_valid:
+                    self.saved_image[:] = memoryview(image)[0:record_size]
+                return True
+            print("Warning: journal slot", newest_slot, "is corrupted")
+
+        # no record, the legacy config is in the slot 0 so the first commit goes to the slot 1. Its
+        # size depends on its version, as much as a record can hold is read
+        memoryview(image)[0:JOURNAL_IMAGE_MAX_SIZE] = self.lx_hardware.get_eeprom_data(
+            LEGACY_CONFIG_E_ADDR, JOURNAL_IMAGE_MAX_SIZE)
+        self.slot = 0
+        self.sequence = 0
+        self.loaded_size = JOURNAL_IMAGE_MAX_SIZE
+        self.saved_image_valid = False
+        return False
+
+    def is_committing(self):
+        return self.commit_position != COMMIT_IDLE
+
+    # number of image bytes not processed yet by the running commit
+    def get_backlog(self):
+        if self.commit_position == COMMIT_IDLE:
+            return 0
+        return self.image_size - self.commit_position
+
+    # start writing image in the next slot, return False if it's already the saved record.
+    # The record is written by commit_step
+    def start_commit(self, image):
+        if self.saved_image_valid and image == self.saved_image:
+            return False
+        self.commit_image[:] = image
+        self.commit_slot = (self.slot + 1) % JOURNAL_SLOTS
+        self.commit_position = 0
+        self.commit_crc = CRC16_INIT
+        self.commit_start_ms = ticks_ms()
+        self.last_save_writes = 0
+        return True
+
+    # continue the running commit within the step budget. The image is processed one eeprom page
+    # at a time: the old content of the page is read and only the span of changed bytes is
+    # written. When the whole image is written, the header commits the record
+    def commit_step(self):
+        if self.commit_position == COMMIT_IDLE:
+            return
+
+        step_start_ms = ticks_ms()
+        written_bytes = 0
+        image = self.commit_image
+        slot_image = self.slot_image
+        slot_addr = self.__slot_addr(self.commit_slot)
+        image_addr = slot_addr + JOURNAL_HEADER_SIZE
+
+        while self.commit_position < self.image_size:
+            start = self.commit_position
+            # end at the next eeprom page boundary
+            end = min(self.image_size, ((image_addr + start) //
+                      EEPROM_PAGE_SIZE + 1) * EEPROM_PAGE_SIZE - image_addr)
+
+            if written_bytes > 0:
+                if written_bytes + end - start > COMMIT_STEP_BUDGET_BYTES or ticks_ms() - step_start_ms >= COMMIT_STEP_BUDGET_MS:
+                    return
+            memoryview(slot_image)[start:end] = self.lx_hardware.get_eeprom_data(
+                image_addr+start, end-start)
+
+            first_changed = -1
+            last_changed = -1
+            for index in range(start, end):
+                if image[index] != slot_image[index]:
+                    if first_changed == -1:
+                        first_changed = index
+                    last_changed = index
+            if first_changed != -1:
+                self.lx_hardware.set_eeprom_data(
+                    image_addr+first_changed, memoryview(image)[first_changed:last_changed+1])
+                self.last_save_writes = self.last_save_writes + 1
+                written_bytes = written_bytes + last_changed + 1 - first_changed
+
+            self.commit_crc = crc16_update(self.commit_crc, image, start, end)
+            self.commit_position = end
+
+        sequence = (self.sequence + 1) & 0xFFFF
+        header = self.header
+        header[JOURNAL_HEADER_MAGIC] = JOURNAL_MAGIC
+        self.__write_u16(header, JOURNAL_HEADER_SEQUENCE, sequence)
+        self.__write_u16(header, JOURNAL_HEADER_SIZE_FIELD, self.image_size)
+        self.__write_u16(header, JOURNAL_HEADER_CRC, self.commit_crc)
+        self.lx_hardware.set_eeprom_data(slot_addr, header)
+        self.last_save_writes = self.last_save_writes + 1
+
+        self.slot = self.commit_slot
+        self.sequence = sequence
+        self.saved_image[:] = image
+        self.saved_image_valid = True
+        self.commit_position = COMMIT_IDLE
+        self.last_save_duration_ms = ticks_ms() - self.commit_start_ms
+
+    def __read_u16(self, data, index):
+        return data[index] | (data[index+1] << 8)
+
+    def __write_u16(self, data, index, value):
+        data[index] = value & 0xFF
+        data[index+1] = (value >> 8) & 0xFF
@@ -1,11 +1,10 @@
+from array import array
 from micropython import const
 from machine import Pin
+from utime import ticks_ms, ticks_diff, ticks_add
 
 from ads1x15 import ADS1115
 
-MIN = const(0)
-MAX = const(1)
-
 LOW_PERCENTAGE_RISING_THRESHOLD = const(25)
 RISING_DIFFERENCE_THRESHOLD = const(50)
 
@@ -16,16 +15,66 @@ CV_MINUS_5V = const(26672)
 
 CV_RHYTHM_MASKS = [const(1), const(2), const(4), const(8)]
 
+# a cv route is a (rhythm, action) listening to a cv input packed in one int
+CV_ROUTE_RHYTHM_SHIFT = const(4)
+CV_ROUTE_ACTION_MASK = const(0x0F)
+
+# data rates used by ADS1115, 7 = 860 samples per second, 5 = 250 samples per second
+ADC_FAST_RATE = const(7)
+ADC_SLOW_RATE = const(5)
+
+# how a cv input is sampled depending on the actions listening to it
+CV_SAMPLING_NONE = const(0)
+CV_SAMPLING_SLOW = const(1)
+CV_SAMPLING_FAST = const(2)
+# when a fast input exists, slow inputs are only sampled once every CV_SLOW_SAMPLING_DIVIDER rounds
+CV_SLOW_SAMPLING_DIVIDER = const(4)
+# if the ALERT/RDY falling edge didn't come after this delay, the conversion is polled
+ADC_READY_TIMEOUT_MS = const(5)
+# a blocking conversion at ADC_SLOW_RATE takes about 4ms, it's an error if it isn't done after this
+ADC_CONVERSION_TIMEOUT_MS = const(50)
+
+# slow inputs are filtered by a one pole filter: filtered += (raw-filtered) >> shift
+CV_DEFAULT_FILTER_SHIFT = const(2)
+# and only a change of at least this percent is reported
+CV_DEFAULT_HYSTERESIS_PERCENT = const(2)
+
 MAX_PERCENT = const(100)
 ALPHA_EXP_PERCENT = const(2)
 
+# response curves applied on the -100..100 percent of a cv action
+CV_CURVE_LINEAR = const(0)
+CV_CURVE_EXP = const(1)
+CV_CURVE_LOG = const(2)
+CV_CURVE_S = const(3)
+CV_CURVE_LEN = const(4)
+CV_CURVE_SIZE = const(201)
+
 
-def percent_to_exp_percent(percent):
+def compute_curve_percent(curve, percent):
     if percent < 0:
         sign = -1
     else:
         sign = 1
-    return sign*int(((abs(percent)/MAX_PERCENT)**ALPHA_EXP_PERCENT)*MAX_PERCENT)
+    ratio = abs(percent)/MAX_PERCENT
+    if curve == CV_CURVE_EXP:
+        return sign*int((ratio**ALPHA_EXP_PERCENT)*MAX_PERCENT)
+    elif curve == CV_CURVE_LOG:
+        return sign*int((ratio**(1/ALPHA_EXP_PERCENT))*MAX_PERCENT)
+    elif curve == CV_CURVE_S:
+        # smoothstep on the whole -100..100 range
+        ratio = (percent+MAX_PERCENT)/(2*MAX_PERCENT)
+        return int(round((3*ratio**2 - 2*ratio**3)*2*MAX_PERCENT)) - MAX_PERCENT
+    return percent
+
+
+# computed once at boot, curve n of percent p is CV_CURVES[n*CV_CURVE_SIZE+p+100]
+CV_CURVES = array("b", [compute_curve_percent(curve, percent) for curve in range(
+    0, CV_CURVE_LEN) for percent in range(-MAX_PERCENT, MAX_PERCENT+1)])
+
+
+def apply_cv_curve(curve, percent):
+    return CV_CURVES[curve*CV_CURVE_SIZE + percent + MAX_PERCENT]
 
 
 class CvAction:
@@ -51,13 +100,27 @@ class CvChannel:
 
 class ChannelCvData:
 
-    def __init__(self, cv_actions_channel):
+    def __init__(self, cv_actions_channel, rhythm_index, cv_manager):
         # cv_actions_channel is an array of len 8 with linked CV_CHANNEL
         self.cv_actions_channel = cv_actions_channel
+        self.rhythm_index = rhythm_index
+        # shared by all rhythms, cv_routes[cv input] is the sorted list of the cv routes
+        # listening to this input
+        self.cv_manager = cv_manager
+        self.cv_routes = cv_manager.cv_routes
 
     def set_cv_actions_channel(self, cv_action_index, cv_channel):
         if cv_action_index <= CV_ACTION_BURST and cv_channel <= CV_CHANNEL_THREE:
+            cv_route = (self.rhythm_index << CV_ROUTE_RHYTHM_SHIFT) | cv_action_index
+            previous_cv_channel = self.cv_actions_channel[cv_action_index]
+            if previous_cv_channel != CvChannel.CV_CHANNEL_NONE:
+                self.cv_routes[previous_cv_channel-1].remove(cv_route)
             self.cv_actions_channel[cv_action_index] = cv_channel
+            if cv_channel != CvChannel.CV_CHANNEL_NONE:
+                self.cv_routes[cv_channel-1].append(cv_route)
+                self.cv_routes[cv_channel-1].sort()
+            if previous_cv_channel != cv_channel:
+                self.cv_manager.update_channels_sampling()
 
     def clear_cv_actions_channel(self):
         for i in range(0, CvAction.CV_ACTION_LEN):
@@ -69,54 +132,229 @@ class CvManager:
 
     def __init__(self, i2c):
         self.i2c = i2c
-        self.adc_ready = Pin(6, Pin.IN)
+        # ALERT/RDY is open drain
+        self.adc_ready = Pin(6, Pin.IN, Pin.PULL_UP)
+
+        # set by the ALERT/RDY interrupt when a conversion is done
+        self.adc_ready_flag = False
 
         self.is_adc_detected = self.ADC_ADDR in self.i2c.scan()
         if self.is_adc_detected:
             self.adc = ADS1115(i2c, address=self.ADC_ADDR)
+            self.adc.set_conversion_ready_mode()
+            self.adc_ready.irq(handler=self.adc_ready_change,
+                               trigger=Pin.IRQ_FALLING, hard=True)
         else:
             self.adc = None
 
-        self.cvs_bound = [CV_MINUS_5V, CV_5V]
+        # raw value of 5V and span from 5V to -5V of each input, default from the fitted line
+        # f(x), replaced by the calibration of the module if there is one
+        self.cvs_bound_5v = [CV_5V, CV_5V, CV_5V, CV_5V]
+        self.cvs_span = [CV_MINUS_5V-CV_5V, CV_MINUS_5V -
+                         CV_5V, CV_MINUS_5V-CV_5V, CV_MINUS_5V-CV_5V]
+
+        # response curve of each action, beats keep their historical exponential response
+        self.action_curves = bytearray(CvAction.CV_ACTION_LEN)
+        self.action_curves[CvAction.CV_ACTION_BEATS] = CV_CURVE_EXP
 
-        self.__raw_values = [0, 0, 0, 0]
+        self.__raw_values = [CV_0V, CV_0V, CV_0V, CV_0V]
         self.percent_values = [0, 0, 0, 0]
 
-        self.cvs_data = [ChannelCvData(cv_actions_channel=[CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN)),
+        # filter and hysteresis of each input, fast inputs (edges) are never filtered
+        self.filter_shifts = bytearray([CV_DEFAULT_FILTER_SHIFT]*4)
+        self.hysteresis_percents = bytearray(
+            [CV_DEFAULT_HYSTERESIS_PERCENT]*4)
+        # number of changes not reported because of the hysteresis and how many of them would
+        # have refreshed the display
+        self.suppressed_updates = 0
+        self.suppressed_frames = 0
+
+        # routing index of the cvs_data, cv_routes[cv input] are the (rhythm, action) to update
+        # when this input changes so there is no need to scan every action of every rhythm
+        self.cv_routes = [[], [], [], []]
+
+        self.cvs_data = [ChannelCvData(cv_actions_channel=[CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN), rhythm_index=0, cv_manager=self),
                          ChannelCvData(cv_actions_channel=[
-                                       CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN)),
+                                       CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN), rhythm_index=1, cv_manager=self),
                          ChannelCvData(cv_actions_channel=[
-                                       CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN)),
-                         ChannelCvData(cv_actions_channel=[CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN))]
+                                       CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN), rhythm_index=2, cv_manager=self),
+                         ChannelCvData(cv_actions_channel=[CvAction.CV_ACTION_NONE]*(CvAction.CV_ACTION_LEN), rhythm_index=3, cv_manager=self)]
+
+        # start at the last channel so the first measure is on channel 0
+        self.current_channel_measure = 3
+        self.in_measure = False
+        self.measure_start_ms = 0
+        # set when the 4 channels were read
+        self.round_completed = False
 
-        self.current_channel_measure = 0
+        # CV_SAMPLING_x of each input, unused inputs are not measured unless sample_all_channels
+        self.channels_sampling = bytearray(4)
+        self.has_fast_channel = False
+        self.sample_all_channels = False
+        self.sampling_round = 0
+        self.update_channels_sampling()
+
+    # this function is called by an interrupt, this is why it cannot allocate any memory
+    def adc_ready_change(self, pin):
+        self.adc_ready_flag = True
+
+    # edge like actions need to be sampled fast, others only follow slow moving parameters
+    def update_channels_sampling(self):
+        self.has_fast_channel = False
+        for channel in range(0, 4):
+            if self.sample_all_channels:
+                channel_sampling = CV_SAMPLING_SLOW
+            else:
+                channel_sampling = CV_SAMPLING_NONE
+            for cv_route in self.cv_routes[channel]:
+                cv_action = cv_route & CV_ROUTE_ACTION_MASK
+                if cv_action in [CvAction.CV_ACTION_RESET, CvAction.CV_ACTION_BURST, CvAction.CV_ACTION_MUTE, CvAction.CV_ACTION_FILL]:
+                    channel_sampling = CV_SAMPLING_FAST
+                    self.has_fast_channel = True
+                    break
+                elif cv_action != CvAction.CV_ACTION_NONE:
+                    channel_sampling = CV_SAMPLING_SLOW
+            self.channels_sampling[channel] = channel_sampling
+
+    # calibration measured at 0V and 5V, -5V is symmetric to 5V around 0V
+    def set_cv_calibration(self, channel, raw_0v, raw_5v):
+        # precomputed so the conversion of a sample is done with integers only
+        self.cvs_bound_5v[channel] = raw_5v
+        self.cvs_span[channel] = 2*(raw_0v - raw_5v)
+
+    # blocking, only used by the cv calibration. Return None if the adc is missing or a
+    # conversion failed
+    def read_raw_average(self, channel, samples=16):
+        if self.adc is None:
+            return None
+        # the non blocking measure starts again after
         self.in_measure = False
+        total = 0
+        for _ in range(0, samples):
+            if not self.adc.start_conversion(channel1=channel, rate=ADC_SLOW_RATE):
+                return None
+            deadline_ms = ticks_add(ticks_ms(), ADC_CONVERSION_TIMEOUT_MS)
+            while not self.adc.is_conversion_done():
+                if ticks_diff(deadline_ms, ticks_ms()) <= 0:
+                    print("Error: cv conversion timeout")
+                    return None
+            value = self.adc.read_conversion()
+            if value is None:
+                return None
+            total = total + value
+        return total // samples
+
+    def set_action_curve(self, cv_action, curve):
+        if curve < CV_CURVE_LEN:
+            self.action_curves[cv_action] = curve
+
+    def get_action_percent(self, cv_action, percent):
+        return apply_cv_curve(self.action_curves[cv_action], percent)
+
+    def set_channel_filter(self, channel, filter_shift, hysteresis_percent):
+        self.filter_shifts[channel] = filter_shift
+        self.hysteresis_percents[channel] = max(1, hysteresis_percent)
+
+    # used by test mode to display every input
+    def set_sample_all_channels(self, sample_all_channels):
+        self.sample_all_channels = sample_all_channels
+        self.update_channels_sampling()
+
+    # next input to measure, None if no input needs to be measured
+    def __next_channel(self):
+        channel = self.current_channel_measure
+        for _ in range(0, 4):
+            channel = (channel + 1) % 4
+            if channel == 0:
+                self.round_completed = True
+                self.sampling_round = (
+                    self.sampling_round + 1) % CV_SLOW_SAMPLING_DIVIDER
+            channel_sampling = self.channels_sampling[channel]
+            if channel_sampling == CV_SAMPLING_FAST:
+                return channel
+            elif channel_sampling == CV_SAMPLING_SLOW:
+                if not self.has_fast_channel or self.sampling_round == 0:
+                    return channel
+        return None
+
+    def __start_measure(self):
+        self.adc_ready_flag = False
+        channel = self.__next_channel()
+        if channel is None:
+            self.in_measure = False
+            return
+        self.current_channel_measure = channel
+        if self.channels_sampling[channel] == CV_SAMPLING_FAST:
+            rate = ADC_FAST_RATE
+        else:
+            rate = ADC_SLOW_RATE
+        self.in_measure = self.adc.start_conversion(
+            channel1=channel, rate=rate)
+        self.measure_start_ms = ticks_ms()
 
     # will return [changing_channel, rising_edge_detected] if data has changed else, None
     def update_cvs_read_non_blocking(self):
         to_return = None
-        return_value = self.adc.read_non_blocking(
-            channel1=self.current_channel_measure, rate=6)  # launch a measure
-        if return_value is not None:
+        if not self.in_measure:
+            self.__start_measure()
+            return to_return
+
+        # the conversion is read once when ALERT/RDY tells it's done, it's only polled if the
+        # interrupt didn't come in time
+        if self.adc_ready_flag:
+            return_value = self.adc.read_conversion()
+        elif ticks_ms() - self.measure_start_ms > ADC_READY_TIMEOUT_MS and self.adc.is_conversion_done():
+            return_value = self.adc.read_conversion()
+        else:
+            return to_return
+
+        if return_value is None:
+            # read failed, measure the next channel
+            self.in_measure = False
+        else:
+            channel = self.current_channel_measure
+            old_percent_values = self.percent_values[channel]
 
-            old_percent_values = self.percent_values[self.current_channel_measure]
+            if self.channels_sampling[channel] == CV_SAMPLING_FAST:
+                # edges can't be delayed by the filter
+                self.__raw_values[channel] = return_value
+                hysteresis_percent = 1
+            else:
+                self.__raw_values[channel] = self.__raw_values[channel] + \
+                    ((return_value -
+                     self.__raw_values[channel]) >> self.filter_shifts[channel])
+                hysteresis_percent = self.hysteresis_percents[channel]
 
-            self.__raw_values[self.current_channel_measure] = return_value
-            self.__compute_percent_cv(self.current_channel_measure)
-            if old_percent_values != self.percent_values[self.current_channel_measure]:
+            percent_value = self.__compute_percent_cv(channel)
+            percent_difference = abs(percent_value - old_percent_values)
+            # bounds are always reported so they can be reached whatever the hysteresis
+            if percent_difference >= hysteresis_percent or (percent_difference != 0 and abs(percent_value) == MAX_PERCENT):
+                self.percent_values[channel] = percent_value
                 rising_edge_detected = False
-                if old_percent_values < LOW_PERCENTAGE_RISING_THRESHOLD and (self.percent_values[self.current_channel_measure]-old_percent_values) >= RISING_DIFFERENCE_THRESHOLD:
+                if old_percent_values < LOW_PERCENTAGE_RISING_THRESHOLD and (percent_value-old_percent_values) >= RISING_DIFFERENCE_THRESHOLD:
                     rising_edge_detected = True
-                to_return = [self.current_channel_measure,
+                to_return = [channel,
                              rising_edge_detected]
-            self.current_channel_measure = (
-                self.current_channel_measure + 1) % 4
+            elif percent_difference != 0:
+                self.suppressed_updates = self.suppressed_updates + 1
+                # a reported change on a used input refreshes the display
+                if len(self.cv_routes[channel]) > 0:
+                    self.suppressed_frames = self.suppressed_frames + 1
+            # next conversion runs while the result is used
+            self.__start_measure()
 
         return to_return
 
+    # return True once per complete round of the 4 channels
+    def is_round_completed(self):
+        if self.round_completed:
+            self.round_completed = False
+            return True
+        return False
+
     # percent are both positive and negative: -5V = -100%; 0V = 0%; 5V = 100%;
     def __compute_percent_cv(self, channel):
-        value = 100-int((self.cvs_bound[MAX]-self.__raw_values[channel])/(
-            self.cvs_bound[MAX]-self.cvs_bound[MIN])*200)
+        value = MAX_PERCENT - ((self.__raw_values[channel]-self.cvs_bound_5v[channel])
+                               * 2*MAX_PERCENT) // self.cvs_span[channel]
 
-        self.percent_values[channel] = max(-100, (min(100, value)))
+        return max(-100, (min(100, value)))
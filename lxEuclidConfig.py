@@ -1,20 +1,69 @@
 from _thread import allocate_lock
-from random import randint
+from array import array
 from micropython import const
-from utime import ticks_ms, sleep
-from ucollections import OrderedDict
+from utime import ticks_ms, ticks_us, sleep
 
-from cvManager import CvAction, CvChannel, LOW_PERCENTAGE_RISING_THRESHOLD, percent_to_exp_percent
+from configJournal import ConfigJournal, JOURNAL_IMAGE_MAX_SIZE, JOURNAL_END_E_ADDR, JOURNAL_SLOTS
+from cvManager import CvAction, CvChannel, LOW_PERCENTAGE_RISING_THRESHOLD, CV_RHYTHM_MASKS, CV_ROUTE_RHYTHM_SHIFT, CV_ROUTE_ACTION_MASK
+from rhythmPatterns import MAX_BEATS, ALGO_EUCLIDEAN, ALGO_SYMMETRIC_EXPONENTIAL, PATTERN_TABLE, pattern_index, get_pattern_step, rotate_pattern_half
 
 T_CLK_LED_ON_MS = const(10)
 T_GATE_ON_MS = const(10)
+T_GATE_MAX_MS = const(250)
 
-MAX_BEATS = const(32)
+# a pattern slot of EuclideanRhythm.patterns, each rhythm holds two slots
+PATTERN_SLOT_LOW = const(0)
+PATTERN_SLOT_HIGH = const(1)
+PATTERN_SLOT_BEATS = const(2)
+PATTERN_SLOT_ROTATED_LOW = const(3)
+PATTERN_SLOT_ROTATED_HIGH = const(4)
+PATTERN_SLOT_LEN = const(5)
+
+# gate length are at most 250ms, this marks a step of the gate schedule to be rolled
+GATE_SCHEDULE_EMPTY = const(255)
+
+# channels seeds are spread so they don't share the same random sequence
+RANDOM_SEED_CHANNEL_STEP = const(0x3779)
+
+# random hits if the 16 bits xorshift state (1..65535) is below or equal the threshold of the
+# probability (0..100)
+PROBABILITY_THRESHOLDS = array(
+    "H", [(probability*65535)//100 for probability in range(0, 101)])
+
+
+# 16 bits xorshift, state must not be 0. Only small int so it can be used in interrupt
+def xorshift16(state):
+    state ^= (state << 7) & 0xFFFF
+    state ^= state >> 9
+    state ^= (state << 8) & 0xFFFF
+    return state
+
+
+# int(value*percent/100) with small int only (truncated toward 0 like int()) so it doesn't
+# create memory
+def percent_of(value, percent):
+    product = value*percent
+    if product < 0:
+        return -((-product)//100)
+    return product//100
 
 MAJOR_E_ADDR = const(0)
 MINOR_E_ADDR = const(1)
 FIX_E_ADDR = const(2)
 
+# cv calibration is stored in the last bytes of the T24C64 eeprom, away from the saved config:
+# magic, 4*(raw 0V, raw 5V) in 16 bits little endian, checksum
+CV_CALIBRATION_E_ADDR = const(8192-32)
+CV_CALIBRATION_MAGIC = const(0xCA)
+CV_CALIBRATION_SIZE = const(18)
+# a calibration with less than this raw difference between 0V and 5V is refused
+CV_CALIBRATION_MIN_SPAN = const(4096)
+
+CV_CALIBRATION_STEP_0V = const(0)
+CV_CALIBRATION_STEP_5V = const(1)
+CV_CALIBRATION_STEP_SAVED = const(2)
+CV_CALIBRATION_STEP_ERROR = const(3)
+
 CV_PAGE_MAX = const(2)
 PRESET_PAGE_MAX = const(3)
 PADS_PAGE_MAX = const(2)
@@ -71,11 +120,11 @@ class EuclideanRhythmParameters:
         else:
             self.pulses_set_0_1 = False
 
-        self.__pulses_ratio = self.pulses / self.beats
+        # pulses ratio is packed as pulses << 8 | beats so it stays a small int
+        self.__pulses_ratio = (self.pulses << 8) | self.beats
         self.clear_gate_needed = False
         self.gate_length_ms = gate_length_ms
         self.randomize_gate_length = randomize_gate_length
-        self.randomized_gate_length_ms = gate_length_ms
 
         self.algo_index = algo_index
 
@@ -109,10 +158,6 @@ class EuclideanRhythm(EuclideanRhythmParameters):
         self.prescaler = LxEuclidConstant.PRESCALER_LIST[prescaler_index]
         self.prescaler_rhythm_counter = 0
 
-        # var used in get_current_step function. Since it's called in interrupt we can't create memory
-        # so we create those buffer before
-        self.get_current_step_offset = 0
-        self.get_current_step_beats = 0
         self.global_cv_offset = 0
         self.global_cv_probability = 0
 
@@ -151,7 +196,28 @@ class EuclideanRhythm(EuclideanRhythmParameters):
         self.burst_steps_left = 0
         self.current_burst_step = 0
 
-        self.rhythm = []
+        # rhythm is stored as a packed pattern (see rhythmPatterns) with its length and the same
+        # pattern already rotated by offset (or global_cv_offset). There are two slots, a new
+        # pattern is built in the inactive one then active_pattern is flipped in one assignment
+        # so the interrupt and the display thread never read a half built pattern
+        self.patterns = array("H", [0, 0, 1, 0, 0, 0, 0, 1, 0, 0])
+        self.active_pattern = 0
+
+        # gate length in ms of each step of the next cycle (0 no gate), pre-rolled by the main
+        # loop and consumed by the clock interrupt. gate_schedule_refill tells a step is empty,
+        # steps are rolled in the order they are played, starting after last_gate_step.
+        # gate_schedule_generation changes on each clear so a refill can see it was outdated
+        self.gate_schedule = bytearray(MAX_BEATS)
+        self.gate_schedule_key = -1
+        self.gate_schedule_refill = True
+        self.gate_schedule_generation = 0
+        self.last_gate_step = -1
+        self.clear_gate_schedule()
+
+        # random_seed is 0 when the random runs freely, else the state goes back to it on reset
+        self.random_seed = 0
+        self.random_state = 1
+
         self.set_rhythm()
 
     @property
@@ -208,18 +274,62 @@ class EuclideanRhythm(EuclideanRhythmParameters):
 
     def set_offset(self, offset):
         self.offset = offset % self.beats
+        self.update_rotated_pattern()
 
     def incr_offset(self):
         self.offset = (self.offset + 1) % self.beats
+        self.update_rotated_pattern()
 
     def decr_offset(self,):
         self.offset = (self.offset - 1) % self.beats
+        self.update_rotated_pattern()
 
-    def set_cv_percent_offset(self, percent):
+    def set_cv_percent_offset(self, percent, update_rhythm=True):
         self.cv_percent_offset = percent
+        if update_rhythm:
+            self.update_rotated_pattern()
+
+    # rotation is only computed when the pattern or the offset change, not on every clock
+    def update_rotated_pattern(self):
+        active_pattern = self.active_pattern
+        self.__publish_pattern(self.patterns[active_pattern+PATTERN_SLOT_LOW], self.patterns[active_pattern +
+                               PATTERN_SLOT_HIGH], self.patterns[active_pattern+PATTERN_SLOT_BEATS])
+
+    # build the pattern in the inactive slot then make it active
+    def __publish_pattern(self, pattern_low, pattern_high, beats):
         # compute direcctly the global offset for later use in the interrupt function
         self.global_cv_offset = self.offset + \
-            int(len(self.rhythm)*self.cv_percent_offset/100)
+            percent_of(beats, self.cv_percent_offset)
+
+        local_offset = self.offset
+        if self.has_cv_offset:
+            local_offset = self.global_cv_offset
+
+        if self.active_pattern == 0:
+            inactive_pattern = PATTERN_SLOT_LEN
+        else:
+            inactive_pattern = 0
+
+        patterns = self.patterns
+        patterns[inactive_pattern+PATTERN_SLOT_LOW] = pattern_low
+        patterns[inactive_pattern+PATTERN_SLOT_HIGH] = pattern_high
+        patterns[inactive_pattern+PATTERN_SLOT_BEATS] = beats
+        patterns[inactive_pattern+PATTERN_SLOT_ROTATED_LOW] = rotate_pattern_half(
+            pattern_low, pattern_high, beats, local_offset, 0)
+        patterns[inactive_pattern+PATTERN_SLOT_ROTATED_HIGH] = rotate_pattern_half(
+            pattern_low, pattern_high, beats, local_offset, 1)
+
+        # pre-rolled steps stay valid as long as the played pattern is the same
+        active_pattern = self.active_pattern
+        pattern_changed = beats != patterns[active_pattern+PATTERN_SLOT_BEATS]
+        if patterns[inactive_pattern+PATTERN_SLOT_ROTATED_LOW] != patterns[active_pattern+PATTERN_SLOT_ROTATED_LOW]:
+            pattern_changed = True
+        elif patterns[inactive_pattern+PATTERN_SLOT_ROTATED_HIGH] != patterns[active_pattern+PATTERN_SLOT_ROTATED_HIGH]:
+            pattern_changed = True
+
+        self.active_pattern = inactive_pattern
+        if pattern_changed:
+            self.clear_gate_schedule()
 
     def set_cv_percent_probability(self, percent):
         self.cv_percent_prob = percent
@@ -247,23 +357,31 @@ class EuclideanRhythm(EuclideanRhythmParameters):
             self.set_pulses_per_ratio()
         self.set_rhythm()
 
-    def set_cv_percent_beat(self, percent):
+    def set_cv_percent_beat(self, percent, update_rhythm=True):
         self.cv_percent_beat = percent
 
         if not self.pulses_set_0_1:
             self.set_pulses_per_ratio()
-        self.set_rhythm()
+        if update_rhythm:
+            self.set_rhythm()
 
+    # round(local_beat*pulses/beats) with small int only, half is rounded to even like round()
     def __compute_pulses_per_ratio(self, local_beat):
-        computed_pulses_per_ratio = round(local_beat*self.__pulses_ratio)
+        ratio_beats = self.__pulses_ratio & 0xFF
+        scaled_pulses = local_beat*(self.__pulses_ratio >> 8)
+        computed_pulses_per_ratio = scaled_pulses//ratio_beats
+        remainder = (scaled_pulses - computed_pulses_per_ratio*ratio_beats)*2
+        if remainder > ratio_beats or (remainder == ratio_beats and computed_pulses_per_ratio & 1):
+            computed_pulses_per_ratio = computed_pulses_per_ratio + 1
         return max(1, (min(local_beat, computed_pulses_per_ratio)))
 
     def set_pulses_per_ratio(self):
         self.pulses = self.__compute_pulses_per_ratio(self.beats)
 
-    def set_cv_percent_pulse(self, percent):
+    def set_cv_percent_pulse(self, percent, update_rhythm=True):
         self.cv_percent_pulse = percent
-        self.set_rhythm()
+        if update_rhythm:
+            self.set_rhythm()
 
     def incr_pulses(self):
         self.pulses = self.pulses + 1
@@ -273,7 +391,7 @@ class EuclideanRhythm(EuclideanRhythmParameters):
             self.pulses_set_0_1 = True
         else:
             self.pulses_set_0_1 = False
-        self.__pulses_ratio = self.pulses / self.beats
+        self.__pulses_ratio = (self.pulses << 8) | self.beats
         self.set_rhythm()
 
     def decr_pulses(self):
@@ -284,7 +402,7 @@ class EuclideanRhythm(EuclideanRhythmParameters):
             self.pulses_set_0_1 = True
         else:
             self.pulses_set_0_1 = False
-        self.__pulses_ratio = self.pulses / self.beats
+        self.__pulses_ratio = (self.pulses << 8) | self.beats
         self.set_rhythm()
 
     def incr_pulses_probability(self):
@@ -300,7 +418,8 @@ class EuclideanRhythm(EuclideanRhythmParameters):
         if self.prescaler_rhythm_counter == 0:
             self.current_step = self.current_step + 1
 
-            beat_limit = len(self.rhythm)-1
+            beat_limit = self.patterns[self.active_pattern +
+                                       PATTERN_SLOT_BEATS]-1
 
             if self.current_step > beat_limit:
                 self.current_step = 0
@@ -319,7 +438,8 @@ class EuclideanRhythm(EuclideanRhythmParameters):
                 self.current_burst_step = self.current_burst_step + 1
                 to_return = True
 
-                beat_limit = len(self.rhythm)-1
+                beat_limit = self.patterns[self.active_pattern +
+                                       PATTERN_SLOT_BEATS]-1
                 if self.current_burst_step > beat_limit:
                     self.current_burst_step = 0
 
@@ -350,87 +470,148 @@ class EuclideanRhythm(EuclideanRhythmParameters):
         self.in_burst_cv = False
 
     def incr_gate_length(self):
-        if (self.gate_length_ms+10) < 250:
+        if (self.gate_length_ms+10) < T_GATE_MAX_MS:
             self.gate_length_ms = self.gate_length_ms + 10
         else:
-            self.gate_length_ms = 250
+            self.gate_length_ms = T_GATE_MAX_MS
 
     def decr_gate_length(self):
-        if (self.gate_length_ms-10) > 10:
+        if (self.gate_length_ms-10) > T_GATE_ON_MS:
             self.gate_length_ms = self.gate_length_ms - 10
         else:
-            self.gate_length_ms = 10
+            self.gate_length_ms = T_GATE_ON_MS
 
     # this function can be called by an interrupt, this is why it cannot allocate any memory
     def reset_step(self):
         self.reset_step_occure = True
+        if self.random_seed != 0:
+            # locked random, steps are rolled again from the seed starting with the next one
+            self.random_state = self.random_seed
+            self.last_gate_step = -1
+            self.clear_gate_schedule()
+
+    def set_random_seed(self, seed, locked=False):
+        # xorshift state can't be 0
+        seed = seed & 0xFFFF
+        if seed == 0:
+            seed = 1
+        if locked:
+            self.random_seed = seed
+        else:
+            self.random_seed = 0
+        self.random_state = seed
+        self.clear_gate_schedule()
+
+    # this function can be called by an interrupt, this is why it cannot allocate any memory.
+    # roll probability and gate length of step from random_state, returns the new random_state
+    # shifted by 8 with the gate length in ms (0 if no gate) in the low byte
+    def roll_step_gate(self, step, random_state):
+        # pattern is already rotated, a step out of the pattern is read as 0
+        active_pattern = self.active_pattern
+        if get_pattern_step(self.patterns[active_pattern+PATTERN_SLOT_ROTATED_LOW],
+                            self.patterns[active_pattern+PATTERN_SLOT_ROTATED_HIGH], step) == 0:
+            return random_state << 8
+
+        if self.has_cv_prob:
+            probability = self.global_cv_probability
+        else:
+            probability = self.pulses_probability
+        if probability < 100:
+            random_state = xorshift16(random_state)
+            if random_state > PROBABILITY_THRESHOLDS[probability]:
+                return random_state << 8
+
+        # random gate lenght will go from half minimum (10/2) to set gate_length_ms
+        gate_length_ms = self.gate_length_ms
+        if self.randomize_gate_length:
+            random_state = xorshift16(random_state)
+            if gate_length_ms > 5:
+                gate_length_ms = 5 + random_state % (gate_length_ms - 4)
+        return (random_state << 8) | gate_length_ms
 
-    def get_current_burst_step(self):
-        try:
-            self.get_current_step_offset = self.offset
-            self.get_current_step_beats = len(self.rhythm)
-            if self.has_cv_offset:
-                self.get_current_step_offset = self.global_cv_offset
-
-            to_return = self.rhythm[(
-                self.current_burst_step-self.get_current_step_offset) % self.get_current_step_beats]
-
-            if to_return == 0:
-                return 0
-            else:
-                if self.has_cv_prob:
-                    if self.global_cv_probability == 100:
-                        return to_return
-                    elif randint(0, 100) < self.global_cv_probability:
-                        return to_return
-                    else:
-                        return 0
-                else:
-                    if self.pulses_probability == 100:
-                        return to_return
-                    elif randint(0, 100) < self.pulses_probability:
-                        return to_return
-                    else:
-                        return 0
-        except Exception as e:
-            print(e, "x")
-
-    def get_current_step(self):
-        try:
-            self.get_current_step_offset = self.offset
-            self.get_current_step_beats = len(self.rhythm)
-            if self.has_cv_offset:
-                self.get_current_step_offset = self.global_cv_offset
-
-            to_return = self.rhythm[(
-                self.current_step-self.get_current_step_offset) % self.get_current_step_beats]
+    # this function can be called by an interrupt, this is why it cannot allocate any memory
+    def get_step(self, step):
+        rolled_step = self.roll_step_gate(step, self.random_state)
+        self.random_state = rolled_step >> 8
+        if rolled_step & 0xFF:
+            return 1
+        return 0
+
+    # this function can be called by an interrupt, it returns the gate length in ms of a step
+    # (0 if no gate) already rolled by refill_gate_schedule and marks it as consumed
+    def pop_step_gate(self, step):
+        self.last_gate_step = step
+        gate_length_ms = self.gate_schedule[step]
+        if gate_length_ms == GATE_SCHEDULE_EMPTY:
+            # main loop didn't refill this step yet, roll it here from random_state like the
+            # refill would have done next, so a locked seed gives the same sequence anyway
+            rolled_step = self.roll_step_gate(step, self.random_state)
+            self.random_state = rolled_step >> 8
+            return rolled_step & 0xFF
+        self.gate_schedule[step] = GATE_SCHEDULE_EMPTY
+        self.gate_schedule_refill = True
+        return gate_length_ms
+
+    # called by the main loop, pre-roll probability and gate length of every consumed step of
+    # the pattern so the clock interrupt only has to read them
+    def refill_gate_schedule(self):
+        if self.has_cv_prob:
+            gate_schedule_key = self.global_cv_probability
+        else:
+            gate_schedule_key = self.pulses_probability
+        gate_schedule_key = gate_schedule_key | (self.gate_length_ms << 8)
+        if self.randomize_gate_length:
+            gate_schedule_key = gate_schedule_key | (1 << 16)
+
+        # probability or gate length changed, all pre-rolled steps are outdated
+        if gate_schedule_key != self.gate_schedule_key:
+            self.gate_schedule_key = gate_schedule_key
+            self.clear_gate_schedule()
+
+        if not self.gate_schedule_refill:
+            return
+        # cleared first, a step consumed by the interrupt during the refill sets it again
+        self.gate_schedule_refill = False
+        gate_schedule_generation = self.gate_schedule_generation
+        random_state = self.random_state
+        gate_schedule = self.gate_schedule
+        beats = self.patterns[self.active_pattern+PATTERN_SLOT_BEATS]
+
+        # steps are rolled in the order they will be played so the random sequence doesn't
+        # depend on how many steps were consumed since the last refill
+        step = self.last_gate_step + 1
+        if step >= beats:
+            step = 0
+        for _ in range(0, beats):
+            if gate_schedule[step] == GATE_SCHEDULE_EMPTY:
+                rolled_step = self.roll_step_gate(step, random_state)
+                random_state = rolled_step >> 8
+                gate_schedule[step] = rolled_step & 0xFF
+            step = step + 1
+            if step == beats:
+                step = 0
+
+        if gate_schedule_generation == self.gate_schedule_generation:
+            self.random_state = random_state
+        else:
+            # cleared meanwhile (reset, new pattern), what was rolled is outdated
+            self.clear_gate_schedule()
 
-            if to_return == 0:
-                return 0
-            else:
-                if self.has_cv_prob:
-                    if self.global_cv_probability == 100:
-                        return to_return
-                    elif randint(0, 100) < self.global_cv_probability:
-                        return to_return
-                    else:
-                        return 0
-                else:
-                    if self.pulses_probability == 100:
-                        return to_return
-                    elif randint(0, 100) < self.pulses_probability:
-                        return to_return
-                    else:
-                        return 0
-        except Exception as e:
-            print(e, "x")
+    # this function can be called by an interrupt, this is why it cannot allocate any memory
+    def clear_gate_schedule(self):
+        gate_schedule = self.gate_schedule
+        for step in range(0, MAX_BEATS):
+            gate_schedule[step] = GATE_SCHEDULE_EMPTY
+        self.gate_schedule_generation = (self.gate_schedule_generation + 1) & 0xFF
+        self.gate_schedule_refill = True
 
     def set_rhythm(self):
         local_beats = self.beats
         local_pulse = self.pulses
 
         if self.has_cv_beat:
-            local_beats = local_beats+int(MAX_BEATS*self.cv_percent_beat/100)
+            local_beats = local_beats + \
+                percent_of(MAX_BEATS, self.cv_percent_beat)
 
             if local_beats > MAX_BEATS:
                 local_beats = MAX_BEATS
@@ -441,7 +622,7 @@ class EuclideanRhythm(EuclideanRhythmParameters):
                 local_pulse = self.__compute_pulses_per_ratio(local_beats)
         if self.has_cv_pulse:
             local_pulse = local_pulse + \
-                int(local_beats*self.cv_percent_pulse/100)
+                percent_of(local_beats, self.cv_percent_pulse)
         # range back beats from 1 to MAX_BEATS
         if local_beats > MAX_BEATS:
             local_beats = MAX_BEATS
@@ -454,114 +635,20 @@ class EuclideanRhythm(EuclideanRhythmParameters):
         elif local_pulse < 0:
             local_pulse = 0
 
+        # only small int math above and patterns are precomputed at boot, finding the right one
+        # doesn't create memory
         if self.is_mute:
-            self.rhythm = [0]*local_beats
+            index = pattern_index(ALGO_EUCLIDEAN, local_beats, 0)
         elif self.is_fill:
-            self.rhythm = [1]*local_beats
-        elif local_pulse == 0:
-            self.rhythm = [0]*local_beats
-        elif local_pulse == 1:
-            self.rhythm = [1]*1+[0]*(local_beats-1)
-        elif local_beats == local_pulse:
-            self.rhythm = [1]*local_beats
-        else:
-            if self.algo_index == 0:
-                self.rhythm = self.__set_rhythm_bjorklund(
-                    local_beats, local_pulse)
-            elif self.algo_index == 1:
-                self.rhythm = self.__exponential_rhythm(
-                    local_beats, local_pulse)
-            elif self.algo_index == 2:
-                self.rhythm = self.__exponential_rhythm(
-                    local_beats, local_pulse, True)
-            else:
-                self.rhythm = self.__symmetric_exponential(
-                    local_beats, local_pulse)
-
-    # from https://github.com/brianhouse/bjorklund/tree/master
-    def __set_rhythm_bjorklund(self, beats, pulses):
-        pattern = []
-        counts = []
-        remainders = []
-        divisor = beats - pulses
-        remainders.append(pulses)
-        level = 0
-        while True:
-            counts.append(divisor // remainders[level])
-            remainders.append(divisor % remainders[level])
-            divisor = remainders[level]
-            level = level + 1
-            if remainders[level] <= 1:
-                break
-        counts.append(divisor)
-
-        def build(level):
-            if level == -1:
-                pattern.append(0)
-            elif level == -2:
-                pattern.append(1)
-            else:
-                for _ in range(0, counts[level]):
-                    build(level - 1)
-                if remainders[level] != 0:
-                    build(level - 2)
-
-        build(level)
-        i = pattern.index(1)
-        pattern = pattern[i:] + pattern[0:i]
-        return pattern
-
-    def __exponential_rhythm(self, beats, pulses, reverse=False):
-        if pulses == 0:
-            return [0]*beats
-        elif pulses == 1:
-            return [1]*1+[0]*(beats-1)
-        else:
-            alpha = 1.4
-
-            # Calculate the exponential positions
-            positions = [round((i / (pulses - 1))**alpha * (beats - 1))
-                         for i in range(pulses)]
-
-            # Make sure all positions are unique
-            positions = list(set(positions))
-
-            # If fewer unique positions than k, fill in the gaps
-            while len(positions) < pulses:
-                for i in range(1, beats):
-                    if i not in positions:
-                        positions.append(i)
-                    if len(positions) >= pulses:
-                        break
-
-            # Create the rhythm array
-            rhythm = [0] * beats
-            for pos in positions:
-                rhythm[pos] = 1
-            if reverse:
-                return list(reversed(rhythm))
-            else:
-                return rhythm
-
-    def __symmetric_exponential(self, beats, pulses):
-
-        if beats % 2 == 1:
-            rhythm0_n = int(beats/2)
-            rhythm1_n = rhythm0_n+1
-        else:
-            rhythm0_n = int(beats/2)
-            rhythm1_n = rhythm0_n
-
-        if pulses % 2 == 1:
-            rhythm0_k = int(pulses/2)
-            rhythm1_k = rhythm0_k+1
+            index = pattern_index(ALGO_EUCLIDEAN, local_beats, local_beats)
         else:
-            rhythm0_k = int(pulses/2)
-            rhythm1_k = rhythm0_k
+            algo_index = self.algo_index
+            if algo_index > ALGO_SYMMETRIC_EXPONENTIAL:
+                algo_index = ALGO_SYMMETRIC_EXPONENTIAL
+            index = pattern_index(algo_index, local_beats, local_pulse)
 
-        r_0 = self.__exponential_rhythm(rhythm0_n, rhythm0_k)
-        r_1 = self.__exponential_rhythm(rhythm1_n, rhythm1_k, True)
-        return r_1+r_0
+        self.__publish_pattern(
+            PATTERN_TABLE[index], PATTERN_TABLE[index+1], local_beats)
 
 
 class LxEuclidConstant:
@@ -633,6 +720,11 @@ class LxEuclidConstant:
 
     PRESCALER_LIST = [1, 2, 3, 4, 6, 8, 16]
 
+    # presets are selected by bank of 8 (one per circle position)
+    PRESET_BANKS = const(8)
+    PRESETS_PER_BANK = const(8)
+    PRESETS_LEN = const(64)
+
     CALIBRATION_COUNTDOWN_DURATION_MS = const(5000)  # 5 seconds
 
     # BURST_LIST is in subdivision of 24 (BURST_SUBDIVISION)
@@ -641,6 +733,293 @@ class LxEuclidConstant:
     BURST_SUBDIVISION = const(24)
 
 
+# the config is stored as a fixed binary image. A field is (attribute name, offset, width in
+# bytes, min, max), multi bytes fields are little endian. The same fields serialise the config
+# and load it back, a loaded value out of [min, max] is ignored
+RHYTHM_CONFIG_FIELDS = (
+    ("beats", 0, 1, 1, MAX_BEATS),
+    ("pulses", 1, 1, 0, MAX_BEATS),
+    ("offset", 2, 1, 0, MAX_BEATS),
+    ("pulses_probability", 3, 1, 0, 100),
+    ("algo_index", 4, 1, ALGO_EUCLIDEAN, ALGO_SYMMETRIC_EXPONENTIAL),
+    ("prescaler_index", 5, 1, 0, len(LxEuclidConstant.PRESCALER_LIST)-1),
+    ("gate_length_ms", 6, 1, T_GATE_ON_MS, T_GATE_MAX_MS),
+    ("randomize_gate_length", 7, 1, 0, 1),
+    ("burst_div_index", 8, 1, 0, len(LxEuclidConstant.BURST_LIST)-1),
+)
+RHYTHM_CONFIG_SIZE = const(9)
+
+# 4 rhythms after the version, presets are in the preset bank
+CONFIG_RHYTHMS_ADDR = const(3)
+
+CONFIG_FIELDS = (
+    ("inner_rotate_action", 39, 1, LxEuclidConstant.CIRCLE_ACTION_NONE,
+     LxEuclidConstant.CIRCLE_ACTION_BURST),
+    ("inner_action_rhythm", 40, 1, 0, 15),
+    ("outer_rotate_action", 41, 1, LxEuclidConstant.CIRCLE_ACTION_NONE,
+     LxEuclidConstant.CIRCLE_ACTION_BURST),
+    ("outer_action_rhythm", 42, 1, 0, 15),
+    ("touch_sensitivity", 43, 1, 0, 2),
+    ("clk_mode", 44, 1, LxEuclidConstant.TAP_MODE, LxEuclidConstant.CLK_IN),
+    ("tap_delay_ms", 81, 2, LxEuclidConstant.MIN_TAP_DELAY_MS,
+     LxEuclidConstant.MAX_TAP_DELAY_MS),
+    ("flip", 83, 1, 0, 1),
+    ("preset_recall_mode", 84, 1, LxEuclidConstant.PRESET_RECALL_DIRECT_W_RESET,
+     LxEuclidConstant.PRESET_INTERNAL_RESET),
+    ("preset_bank_index", 85, 1, 0, LxEuclidConstant.PRESET_BANKS-1),
+)
+
+# 4 cvs of CV_ACTION_LEN channels (CV_CHANNEL_NONE..CV_CHANNEL_THREE)
+CONFIG_CV_ADDR = const(45)
+
+CONFIG_SIZE = const(86)
+
+
+# layout of the config saved by a firmware version, used to migrate it field by field when the
+# memory version changes. Fields are (attribute name, offset, width), the version is always in
+# the first 3 bytes. Presets stored in the config (before the preset bank) are moved to the first
+# presets of the bank. journal_slots is the number of config journal slots of the version, their
+# headers are scanned so the newest record is found. migrate(old_image, new_image) is an optional
+# step called after the fields are moved, for values that changed meaning
+class ConfigLayout:
+    def __init__(self, major, minor, size, rhythm_fields, rhythm_size, rhythms_addr, presets_addr, presets, fields, cv_addr, cv_actions, journal_slots, migrate=None):
+        self.major = major
+        self.minor = minor
+        self.size = size
+        self.rhythm_fields = rhythm_fields
+        self.rhythm_size = rhythm_size
+        self.rhythms_addr = rhythms_addr
+        self.presets_addr = presets_addr
+        self.presets = presets
+        self.fields = fields
+        self.cv_addr = cv_addr
+        self.cv_actions = cv_actions
+        self.journal_slots = journal_slots
+        self.migrate = migrate
+
+
+# every layout the config can be migrated from. When the layout changes, the memory version is
+# incremented and the layout of the previous version is added here as it was
+CONFIG_LAYOUTS = (
+    ConfigLayout(1, 1, 373,
+                 (("beats", 0, 1), ("pulses", 1, 1), ("offset", 2, 1),
+                  ("pulses_probability", 3, 1), ("algo_index", 4, 1),
+                  ("prescaler_index", 5, 1), ("gate_length_ms", 6, 1),
+                  ("randomize_gate_length", 7, 1), ("burst_div_index", 8, 1)),
+                 9, 3, 39, 8,
+                 (("inner_rotate_action", 327, 1), ("inner_action_rhythm", 328, 1),
+                  ("outer_rotate_action", 329, 1), ("outer_action_rhythm", 330, 1),
+                  ("touch_sensitivity", 331, 1), ("clk_mode", 332, 1),
+                  ("tap_delay_ms", 369, 2), ("flip", 371, 1),
+                  ("preset_recall_mode", 372, 1)),
+                 333, 9, 21),
+)
+
+
+def find_config_layout(major, minor):
+    for layout in CONFIG_LAYOUTS:
+        if layout.major == major and layout.minor == minor:
+            return layout
+    return None
+
+
+def find_config_field(fields, name):
+    for field in fields:
+        if field[0] == name:
+            return field
+    return None
+
+
+def read_config_field(image, addr, width):
+    value = 0
+    for byte_index in range(0, width):
+        value |= image[addr+byte_index] << (byte_index*8)
+    return value
+
+
+def write_config_field(image, addr, width, value):
+    for byte_index in range(0, width):
+        image[addr+byte_index] = (value >> (byte_index*8)) & 0xff
+
+
+def serialise_config_fields(image, source, fields, addr):
+    for name, offset, width, _, _ in fields:
+        write_config_field(image, addr+offset, width,
+                           int(getattr(source, name)))
+
+
+def load_config_fields(image, destination, fields, addr):
+    for name, offset, width, min_value, max_value in fields:
+        value = read_config_field(image, addr+offset, width)
+        if value >= min_value and value <= max_value:
+            setattr(destination, name, value)
+
+
+# presets are records of 4 rhythms (RHYTHM_CONFIG_FIELDS) in the eeprom after the config journal
+PRESET_BANK_E_ADDR = JOURNAL_END_E_ADDR
+PRESET_RECORD_SIZE = const(36)
+# presets materialised in ram: the recalled one, the saved ones and the prefetched one
+PRESET_CACHE_SIZE = const(4)
+PRESET_CACHE_EMPTY = const(255)
+
+# (beats, pulses, offset, probability, algo_index) of presets never saved, presets after the
+# factory ones use PRESET_DEFAULT_RHYTHMS
+FACTORY_PRESETS = (
+    ((8, 3, 1, 100, 0), (16, 4, 0, 100, 1), (16, 5, 10, 100, 0), (8, 1, 1, 100, 0)),
+    ((16, 4, 10, 100, 0), (12, 7, 0, 100, 0), (16, 4, 12, 100, 0), (4, 2, 0, 100, 0)),
+    ((12, 1, 7, 100, 0), (6, 5, 0, 100, 0), (3, 1, 2, 100, 0), (6, 1, 5, 100, 0)),
+)
+PRESET_DEFAULT_RHYTHMS = ((16, 4, 0, 100, 0), (8, 1, 4, 100, 0),
+                          (4, 1, 2, 100, 0), (9, 5, 0, 100, 0))
+
+
+# presets stored in the eeprom, only PRESET_CACHE_SIZE of them are kept in ram and the least
+# recently used is replaced. Saved presets are written back and prefetched presets are read by
+# update, called from the display thread, so a recall doesn't wait for the eeprom
+class PresetBank:
+    def __init__(self, lx_hardware):
+        self.lx_hardware = lx_hardware
+        self.bank_lock = allocate_lock()
+
+        self.cache_presets = []
+        for _ in range(0, PRESET_CACHE_SIZE):
+            self.cache_presets.append([EuclideanRhythmParameters(
+                16, 4, 0, 100) for _ in range(0, 4)])
+        self.cache_indexes = bytearray(
+            [PRESET_CACHE_EMPTY]*PRESET_CACHE_SIZE)
+        self.cache_dirty = bytearray(PRESET_CACHE_SIZE)
+        self.cache_last_use = [0]*PRESET_CACHE_SIZE
+        self.use_counter = 0
+
+        self.prefetch_index = PRESET_CACHE_EMPTY
+        self.record = bytearray(PRESET_RECORD_SIZE)
+
+        # recalls served from ram and recalls that had to read the eeprom
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __record_addr(self, preset_index):
+        return PRESET_BANK_E_ADDR + preset_index*PRESET_RECORD_SIZE
+
+    def __cache_entry(self, preset_index):
+        for entry in range(0, PRESET_CACHE_SIZE):
+            if self.cache_indexes[entry] == preset_index:
+                return entry
+        return -1
+
+    # entry to reuse: an empty one or the least recently used one not waiting to be written
+    def __free_cache_entry(self):
+        free_entry = -1
+        for entry in range(0, PRESET_CACHE_SIZE):
+            if self.cache_indexes[entry] == PRESET_CACHE_EMPTY:
+                return entry
+            if not self.cache_dirty[entry] and (free_entry == -1 or self.cache_last_use[entry] < self.cache_last_use[free_entry]):
+                free_entry = entry
+        if free_entry == -1:
+            # every entry waits to be written, write the least recently used now
+            free_entry = 0
+            for entry in range(1, PRESET_CACHE_SIZE):
+                if self.cache_last_use[entry] < self.cache_last_use[free_entry]:
+                    free_entry = entry
+            self.__write_entry(free_entry)
+        return free_entry
+
+    def __use(self, entry):
+        self.use_counter = self.use_counter + 1
+        self.cache_last_use[entry] = self.use_counter
+
+    # read preset_index from the eeprom in a free entry, bank_lock must be held
+    def __read_entry(self, preset_index):
+        entry = self.__free_cache_entry()
+        self.record[:] = self.lx_hardware.get_eeprom_data(
+            self.__record_addr(preset_index), PRESET_RECORD_SIZE)
+        if preset_index < len(FACTORY_PRESETS):
+            default_rhythms = FACTORY_PRESETS[preset_index]
+        else:
+            default_rhythms = PRESET_DEFAULT_RHYTHMS
+        for rhythm_index, preset_euclidean_rhythm in enumerate(self.cache_presets[entry]):
+            beats, pulses, offset, probability, algo_index = default_rhythms[rhythm_index]
+            preset_euclidean_rhythm.set_parameters(
+                beats, pulses, offset, probability, 0, T_GATE_ON_MS, False, algo_index, 0)
+            # fields of a never written record (0xFF) are refused and keep the default
+            load_config_fields(self.record, preset_euclidean_rhythm,
+                               RHYTHM_CONFIG_FIELDS, rhythm_index*RHYTHM_CONFIG_SIZE)
+        self.cache_indexes[entry] = preset_index
+        self.cache_dirty[entry] = False
+        return entry
+
+    def __write_entry(self, entry):
+        for rhythm_index, preset_euclidean_rhythm in enumerate(self.cache_presets[entry]):
+            serialise_config_fields(self.record, preset_euclidean_rhythm,
+                                    RHYTHM_CONFIG_FIELDS, rhythm_index*RHYTHM_CONFIG_SIZE)
+        self.lx_hardware.set_eeprom_data(self.__record_addr(
+            self.cache_indexes[entry]), self.record)
+        self.cache_dirty[entry] = False
+
+    def load_preset(self, preset_index, euclidean_rhythms):
+        self.bank_lock.acquire()
+        entry = self.__cache_entry(preset_index)
+        if entry == -1:
+            self.cache_misses = self.cache_misses + 1
+            entry = self.__read_entry(preset_index)
+        else:
+            self.cache_hits = self.cache_hits + 1
+        self.__use(entry)
+        for index, euclidean_rhythm in enumerate(euclidean_rhythms):
+            euclidean_rhythm.set_parameters_from_rhythm(
+                self.cache_presets[entry][index])
+        self.bank_lock.release()
+
+    def save_preset(self, preset_index, euclidean_rhythms):
+        self.bank_lock.acquire()
+        entry = self.__cache_entry(preset_index)
+        if entry == -1:
+            # the whole preset is overwritten, no need to read it
+            entry = self.__free_cache_entry()
+            self.cache_indexes[entry] = preset_index
+        self.__use(entry)
+        for index, preset_euclidean_rhythm in enumerate(self.cache_presets[entry]):
+            preset_euclidean_rhythm.set_parameters_from_rhythm(
+                euclidean_rhythms[index])
+        self.cache_dirty[entry] = True
+        self.bank_lock.release()
+
+    def prefetch(self, preset_index):
+        self.prefetch_index = preset_index
+
+    # write one saved preset or else read the prefetched one
+    def update(self):
+        self.bank_lock.acquire()
+        for entry in range(0, PRESET_CACHE_SIZE):
+            if self.cache_dirty[entry]:
+                self.__write_entry(entry)
+                self.bank_lock.release()
+                return
+        prefetch_index = self.prefetch_index
+        self.prefetch_index = PRESET_CACHE_EMPTY
+        if prefetch_index != PRESET_CACHE_EMPTY and self.__cache_entry(prefetch_index) == -1:
+            self.__read_entry(prefetch_index)
+        self.bank_lock.release()
+
+    # number of bytes waiting to be written
+    def get_backlog(self):
+        backlog = 0
+        for entry in range(0, PRESET_CACHE_SIZE):
+            if self.cache_dirty[entry]:
+                backlog = backlog + PRESET_RECORD_SIZE
+        return backlog
+
+    # write the whole bank, used when it's created since the eeprom content there is unknown.
+    # records holds every preset record
+    def format(self, records):
+        self.bank_lock.acquire()
+        self.lx_hardware.set_eeprom_data(PRESET_BANK_E_ADDR, records)
+        for entry in range(0, PRESET_CACHE_SIZE):
+            self.cache_indexes[entry] = PRESET_CACHE_EMPTY
+            self.cache_dirty[entry] = False
+        self.bank_lock.release()
+
+
 class LxEuclidConfig:
 
     def __init__(self, lx_hardware, LCD, software_version):
@@ -659,24 +1038,12 @@ class LxEuclidConfig:
         self.euclidean_rhythms.append(EuclideanRhythm(8, 1, 4, 100))
         self.euclidean_rhythms.append(EuclideanRhythm(4, 1, 2, 100))
         self.euclidean_rhythms.append(EuclideanRhythm(9, 5, 0, 100))
+        self.set_random_seed()
 
-        self.presets = []
-        self.presets.append([EuclideanRhythmParameters(8, 3, 1, 100), EuclideanRhythmParameters(
-            16, 4, 0, 100, algo_index=1), EuclideanRhythmParameters(16, 5, 10, 100), EuclideanRhythmParameters(8, 1, 1, 100)])
-        self.presets.append([EuclideanRhythmParameters(16, 4, 10, 100), EuclideanRhythmParameters(
-            12, 7, 0, 100), EuclideanRhythmParameters(16, 4, 12, 100), EuclideanRhythmParameters(4, 2, 0, 100)])
-        self.presets.append([EuclideanRhythmParameters(12, 1, 7, 100), EuclideanRhythmParameters(
-            6, 5, 0, 100), EuclideanRhythmParameters(3, 1, 2, 100), EuclideanRhythmParameters(6, 1, 5, 100)])
-        self.presets.append([EuclideanRhythmParameters(16, 4, 0, 100), EuclideanRhythmParameters(
-            8, 1, 4, 100), EuclideanRhythmParameters(4, 1, 2, 100), EuclideanRhythmParameters(9, 5, 0, 100)])
-        self.presets.append([EuclideanRhythmParameters(16, 4, 0, 100), EuclideanRhythmParameters(
-            8, 1, 4, 100), EuclideanRhythmParameters(4, 1, 2, 100), EuclideanRhythmParameters(9, 5, 0, 100)])
-        self.presets.append([EuclideanRhythmParameters(16, 4, 0, 100), EuclideanRhythmParameters(
-            8, 1, 4, 100), EuclideanRhythmParameters(4, 1, 2, 100), EuclideanRhythmParameters(9, 5, 0, 100)])
-        self.presets.append([EuclideanRhythmParameters(16, 4, 0, 100), EuclideanRhythmParameters(
-            8, 1, 4, 100), EuclideanRhythmParameters(4, 1, 2, 100), EuclideanRhythmParameters(9, 5, 0, 100)])
-        self.presets.append([EuclideanRhythmParameters(16, 4, 0, 100), EuclideanRhythmParameters(
-            8, 1, 4, 100), EuclideanRhythmParameters(4, 1, 2, 100), EuclideanRhythmParameters(9, 5, 0, 100)])
+        # presets are loaded from the eeprom on demand
+        self.preset_bank = PresetBank(self.lx_hardware)
+        # bank shown in the presets page
+        self.preset_bank_index = 0
 
         self.preset_recall_mode = LxEuclidConstant.PRESET_RECALL_DIRECT_W_RESET
         self.preset_recall_int_reset = False
@@ -731,16 +1098,25 @@ class LxEuclidConfig:
         # used in interrupt function that can't create memory
         self.computation_index_incr_step = 0
 
-        self.tap_delay_ms = 125  # default tap tempo 120bmp 125ms for 16th note
+        # rhythms (CV_RHYTHM_MASKS) changed by CVs, regenerated once per complete CVs round
+        self.cv_dirty_rhythms = 0
+        # number of rhythm regenerations avoided by waiting the end of the CVs round
+        self.cv_saved_regenerations = 0
 
-        # list used to test if data changed and needs to be stocked in memory
-        self.previous_dict_data_list = []
+        self.tap_delay_ms = 125  # default tap tempo 120bmp 125ms for 16th note
 
-        # used in create_memory_dict, put it as attribute so it doesn't create memory in loop
-        self.dict_data = OrderedDict()
+        # config_image is serialised by save_data then copied by the display thread in the
+        # journal which commits it in the eeprom
+        self.config_image = bytearray(CONFIG_SIZE)
+        self.config_journal = ConfigJournal(self.lx_hardware, CONFIG_SIZE)
 
         self.load_data()
         self.reload_rhythms()
+        self.load_cv_calibration()
+
+        # step of the cv calibration done in test mode
+        self.cv_calibration_step = CV_CALIBRATION_STEP_0V
+        self.cv_calibration_0v = [0, 0, 0, 0]
 
         self.lx_hardware.capacitives_circles.flip = self._flip
         if self._flip == True:
@@ -766,6 +1142,14 @@ class LxEuclidConfig:
         self.lx_hardware.capacitives_circles.flip = self._flip
         self.flip_lock.release()
 
+    @property
+    def touch_sensitivity(self):
+        return self.lx_hardware.capacitives_circles.touch_sensitivity
+
+    @touch_sensitivity.setter
+    def touch_sensitivity(self, touch_sensitivity):
+        self.lx_hardware.capacitives_circles.touch_sensitivity = touch_sensitivity
+
     @property
     def need_circle_action_display(self):
         if ticks_ms() - self.last_set_need_circle_action_display_ms > LxEuclidConstant.MAX_CIRCLE_DISPLAY_TIME_MS:
@@ -785,12 +1169,8 @@ class LxEuclidConfig:
     @save_preset_index.setter
     def save_preset_index(self, save_preset_index):
         self._save_preset_index = save_preset_index
-        index = 0
-        for preset_euclidean_rhythm in self.presets[self._save_preset_index]:
-            preset_euclidean_rhythm.set_parameters_from_rhythm(
-                self.euclidean_rhythms[index])
-            index = index + 1
-        self.save_data()
+        self.preset_bank.save_preset(
+            self._save_preset_index, self.euclidean_rhythms)
 
     @property
     def load_preset_index(self):
@@ -811,18 +1191,26 @@ class LxEuclidConfig:
             self.preset_recall_int_reset = True
             # if previous reset recall were launched, clear them, only one preset load can be in queue
             self.preset_recall_ext_reset = False
+            # read the preset before the reset recalls it
+            self.preset_bank.prefetch(self._load_preset_index)
         elif self.preset_recall_mode is LxEuclidConstant.PRESET_EXTERNAL_RESET:
             self.preset_recall_ext_reset = True
             # if previous reset recall were launched, clear them, only one preset load can be in queue
             self.preset_recall_int_reset = False
+            self.preset_bank.prefetch(self._load_preset_index)
 
     def delegate_load_preset(self):
-        for index, euclidean_rhythm in enumerate(self.euclidean_rhythms):
-            euclidean_rhythm.set_parameters_from_rhythm(
-                self.presets[self._load_preset_index][index])
-
+        self.preset_bank.load_preset(
+            self._load_preset_index, self.euclidean_rhythms)
+        for euclidean_rhythm in self.euclidean_rhythms:
             euclidean_rhythm.set_rhythm()
 
+        # the next preset of the bank is likely the next one recalled
+        bank_start = self._load_preset_index - \
+            (self._load_preset_index % LxEuclidConstant.PRESETS_PER_BANK)
+        self.preset_bank.prefetch(
+            bank_start + (self._load_preset_index + 1) % LxEuclidConstant.PRESETS_PER_BANK)
+
         # if current recall mode is direct wo reset or, we called previously a preset_recall_ext_reset
         if self.preset_recall_mode is not LxEuclidConstant.PRESET_RECALL_DIRECT_WO_RESET and self.preset_recall_ext_reset is False:
             self.reset_steps()
@@ -949,6 +1337,7 @@ class LxEuclidConfig:
                     elif rotate_action == LxEuclidConstant.CIRCLE_ACTION_BURST:
                         self.euclidean_rhythms[menu_selection_index].start_continue_burst(
                         )
+                        self.lx_hardware.start_burst_subdivisions()
                         self.action_display_info = "b"
 
                     self.action_display_index = menu_selection_index
@@ -1148,11 +1537,14 @@ class LxEuclidConfig:
                 angle_inner = self.lx_hardware.capacitives_circles.inner_circle_angle
 
                 if self.param_presets_page in [0, 1]:
-                    preset_index = angle_to_index(angle_inner, 8)
+                    preset_index = self.preset_bank_index*LxEuclidConstant.PRESETS_PER_BANK + \
+                        angle_to_index(angle_inner, LxEuclidConstant.PRESETS_PER_BANK)
                     if self.param_presets_page == 0:
                         self.load_preset_index = preset_index
                     else:
                         self.save_preset_index = preset_index
+                    # save the selected bank
+                    self.save_data()
 
                     self.state_lock.acquire()
                     self.state = LxEuclidConstant.STATE_LIVE
@@ -1174,6 +1566,15 @@ class LxEuclidConfig:
             elif event == LxEuclidConstant.EVENT_MENU_BTN:
                 self.param_presets_page = (
                     self.param_presets_page+1) % PRESET_PAGE_MAX
+            elif event in [LxEuclidConstant.EVENT_OUTER_CIRCLE_INCR, LxEuclidConstant.EVENT_OUTER_CIRCLE_DECR]:
+                if self.param_presets_page in [0, 1]:
+                    if event == LxEuclidConstant.EVENT_OUTER_CIRCLE_INCR:
+                        self.preset_bank_index = (
+                            self.preset_bank_index+1) % LxEuclidConstant.PRESET_BANKS
+                    else:
+                        self.preset_bank_index = (
+                            self.preset_bank_index-1) % LxEuclidConstant.PRESET_BANKS
+                    self.LCD.set_need_display()
 
         elif self.state == LxEuclidConstant.STATE_RHYTHM_PARAM_INNER_BEAT_PULSE:
             if event == LxEuclidConstant.EVENT_BTN_SWITCHES and data == self.sm_rhythm_param_counter:
@@ -1522,7 +1923,10 @@ class LxEuclidConfig:
                     # so divide circle in 8 and only react to 0 and 4 (top and bottom)
                     param_index = angle_to_index(angle_inner, 8)
                     if param_index == 0:
-                        self.clk_mode = 0
+                        if self.clk_mode != LxEuclidConstant.TAP_MODE:
+                            self.clk_mode = 0
+                            # the internal clock gives the steps in tap mode, it may be stopped
+                            self.lx_hardware.relaunch_internal_clk()
                     elif param_index == 4:
                         self.clk_mode = 1
                 elif self.param_menu_page == 1:  # sensitivity
@@ -1558,13 +1962,12 @@ class LxEuclidConfig:
             if did_step:
                 to_return = True
 
-            if euclidean_rhythm.get_current_burst_step() and did_step and euclidean_rhythm.in_burst:
-                if euclidean_rhythm.randomize_gate_length:
-                    self.lx_hardware.set_gate(
-                        self.computation_index_incr_step, euclidean_rhythm.randomized_gate_length_ms)
-                else:
+            if did_step and euclidean_rhythm.in_burst:
+                gate_length_ms = euclidean_rhythm.pop_step_gate(
+                    euclidean_rhythm.current_burst_step)
+                if gate_length_ms:
                     self.lx_hardware.set_gate(
-                        self.computation_index_incr_step, euclidean_rhythm.gate_length_ms)
+                        self.computation_index_incr_step, gate_length_ms)
             self.computation_index_incr_step = self.computation_index_incr_step + 1
         return to_return
 
@@ -1586,13 +1989,12 @@ class LxEuclidConfig:
                     euclidean_rhythm.prescaler_rhythm_counter = 0
                 did_step = True
 
-            if euclidean_rhythm.get_current_step() and did_step and not (euclidean_rhythm.in_burst):
-                if euclidean_rhythm.randomize_gate_length:
+            if did_step and not (euclidean_rhythm.in_burst):
+                gate_length_ms = euclidean_rhythm.pop_step_gate(
+                    euclidean_rhythm.current_step)
+                if gate_length_ms:
                     self.lx_hardware.set_gate(
-                        self.computation_index_incr_step, euclidean_rhythm.randomized_gate_length_ms)
-                else:
-                    self.lx_hardware.set_gate(
-                        self.computation_index_incr_step, euclidean_rhythm.gate_length_ms)
+                        self.computation_index_incr_step, gate_length_ms)
             self.computation_index_incr_step = self.computation_index_incr_step + 1
 
         if self.state == LxEuclidConstant.STATE_LIVE:
@@ -1600,12 +2002,20 @@ class LxEuclidConfig:
             self.last_gate_led_event = ticks_ms()
             self.clear_led_needed = True
 
-    # random gate lenght will go from half minimum (10/2) to set gate_length_ms
-    def random_gate_length_update(self):
+    # seed None lets the random run freely, any other seed locks the random of every channel
+    # so probabilities and random gate lengths are the same after each reset
+    def set_random_seed(self, seed=None):
+        for index, euclidean_rhythm in enumerate(self.euclidean_rhythms):
+            if seed is None:
+                euclidean_rhythm.set_random_seed(
+                    ticks_us() + index*RANDOM_SEED_CHANNEL_STEP)
+            else:
+                euclidean_rhythm.set_random_seed(
+                    seed + index*RANDOM_SEED_CHANNEL_STEP, True)
+
+    def refill_gate_schedules(self):
         for euclidean_rhythm in self.euclidean_rhythms:
-            if euclidean_rhythm.randomize_gate_length:
-                euclidean_rhythm.randomized_gate_length_ms = randint(
-                    5, euclidean_rhythm.gate_length_ms)
+            euclidean_rhythm.refill_gate_schedule()
 
     def reset_steps(self):
         for euclidean_rhythm in self.euclidean_rhythms:
@@ -1639,261 +2049,197 @@ class LxEuclidConfig:
 
             self.seconds_to_display = remaining_sec
 
-    def create_memory_dict(self):
-        self.dict_data["v_ma"] = self.v_major
-        self.dict_data["v_mi"] = self.v_minor
-        self.dict_data["v_fi"] = self.v_fix
-
-        for rhythm_index, euclidean_rhythm in enumerate(self.euclidean_rhythms):
-            rhythm_prefix = f"e_r_{rhythm_index}_"
-            self.dict_data[rhythm_prefix+"b"] = euclidean_rhythm.beats
-            self.dict_data[rhythm_prefix+"p"] = euclidean_rhythm.pulses
-            self.dict_data[rhythm_prefix+"o"] = euclidean_rhythm.offset
-            self.dict_data[rhythm_prefix +
-                           "pr"] = euclidean_rhythm.pulses_probability
-            self.dict_data[rhythm_prefix+"ai"] = euclidean_rhythm.algo_index
-            self.dict_data[rhythm_prefix +
-                           "p_i"] = euclidean_rhythm.prescaler_index
-            self.dict_data[rhythm_prefix +
-                           "g_l_m"] = euclidean_rhythm.gate_length_ms
-            self.dict_data[rhythm_prefix +
-                           "r_g_l"] = euclidean_rhythm.randomize_gate_length
-            self.dict_data[rhythm_prefix +
-                           "b_d_i"] = euclidean_rhythm.burst_div_index
-
-        for preset_index, preset in enumerate(self.presets):
-            preset_prefix = f"pr_{preset_index}_"
-            for rhythm_index, preset_euclidean_rhythm in enumerate(preset):
-
-                rhythm_prefix = f"{preset_prefix}e_r_{rhythm_index}_"
-
-                self.dict_data[rhythm_prefix +
-                               "b"] = preset_euclidean_rhythm.beats
-                self.dict_data[rhythm_prefix +
-                               "p"] = preset_euclidean_rhythm.pulses
-                self.dict_data[rhythm_prefix +
-                               "o"] = preset_euclidean_rhythm.offset
-                self.dict_data[rhythm_prefix +
-                               "pr"] = preset_euclidean_rhythm.pulses_probability
-                self.dict_data[rhythm_prefix +
-                               "ai"] = preset_euclidean_rhythm.algo_index
-                self.dict_data[rhythm_prefix +
-                               "p_i"] = preset_euclidean_rhythm.prescaler_index
-                self.dict_data[rhythm_prefix +
-                               "g_l_m"] = preset_euclidean_rhythm.gate_length_ms
-                self.dict_data[rhythm_prefix +
-                               "r_g_l"] = preset_euclidean_rhythm.randomize_gate_length
-                self.dict_data[rhythm_prefix +
-                               "b_d_i"] = preset_euclidean_rhythm.burst_div_index
-
-        self.dict_data["i_r_a"] = self.inner_rotate_action
-        self.dict_data["i_a_r"] = self.inner_action_rhythm
-
-        self.dict_data["o_r_a"] = self.outer_rotate_action
-        self.dict_data["o_a_r"] = self.outer_action_rhythm
-
-        self.dict_data["t_s"] = self.lx_hardware.capacitives_circles.touch_sensitivity
-
-        self.dict_data["c_m"] = self.clk_mode
-
-        for cv_index, cv_data in enumerate(self.lx_hardware.cv_manager.cvs_data):
-            for cv_action_index, cv_action_channel in enumerate(cv_data.cv_actions_channel):
-                cv_prefix = f"cv_{cv_index}_{cv_action_index}_"
-                self.dict_data[cv_prefix+"a"] = cv_action_channel
-
-        # split tap tempo in lsb and msb
-        local_tap_tempo = self.tap_delay_ms
-        self.dict_data["t_t_l"] = local_tap_tempo & 0xff
-        self.dict_data["t_t_h"] = (local_tap_tempo >> 8) & 0xff
-
-        self.dict_data["d_o_f"] = self.flip
-
-        self.dict_data["p_r_m"] = self.preset_recall_mode
+    def serialise_config(self):
+        image = self.config_image
+        image[MAJOR_E_ADDR] = self.v_major
+        image[MINOR_E_ADDR] = self.v_minor
+        image[FIX_E_ADDR] = self.v_fix
+
+        addr = CONFIG_RHYTHMS_ADDR
+        for euclidean_rhythm in self.euclidean_rhythms:
+            serialise_config_fields(
+                image, euclidean_rhythm, RHYTHM_CONFIG_FIELDS, addr)
+            addr = addr + RHYTHM_CONFIG_SIZE
+
+        serialise_config_fields(image, self, CONFIG_FIELDS, 0)
+
+        addr = CONFIG_CV_ADDR
+        for cv_data in self.lx_hardware.cv_manager.cvs_data:
+            for cv_action_channel in cv_data.cv_actions_channel:
+                image[addr] = cv_action_channel
+                addr = addr + 1
 
     def save_data(self):
 
         self.save_data_lock.acquire()
 
-        self.create_memory_dict()
+        self.serialise_config()
         self.need_save_data_in_file = True
         self.save_data_lock.release()
 
+    # called by each display thread iteration, writes at most one commit step so a big save
+    # never delays a frame by more than the journal step budget
     def test_save_data_in_file(self):
-        if self.need_save_data_in_file:
+        if self.need_save_data_in_file and not self.config_journal.is_committing():
             self.save_data_lock.acquire()
             self.need_save_data_in_file = False
+            # the journal copies the image so save_data can serialise again while it's written
+            self.config_journal.start_commit(self.config_image)
             self.save_data_lock.release()
 
-            changed_index = []
-            size_previous_dict_data_list = len(self.previous_dict_data_list)
-
-            for index, current_value in enumerate(self.dict_data.values()):
-                # necessary if we change version or at boot when list is empty
-                if index > (size_previous_dict_data_list-1):
-                    changed_index.append(index)
-                elif current_value != self.previous_dict_data_list[index]:
-                    changed_index.append(index)
+        if self.config_journal.is_committing():
+            self.config_journal.commit_step()
+        else:
+            # saved presets are written and the next preset is read when no commit is running
+            self.preset_bank.update()
 
-            # uncomment for debug purpose
-            # if len(changed_index) > 0:
-            #    print("data changed and needs to be put to eeprom", changed_index)
+    # write everything pending now, used at boot before the display thread runs
+    def flush_save_data(self):
+        while self.get_save_backlog() > 0:
+            self.test_save_data_in_file()
 
-            # if previous_dict_data_list is empty, replace it by a list, else just fill it to not create memory
-            if len(self.previous_dict_data_list) == 0:
-                self.previous_dict_data_list = list(self.dict_data.values())
-            else:
-                for index, current_value in enumerate(self.dict_data.values()):
-                    self.previous_dict_data_list[index] = current_value
-
-            if len(changed_index) > 0:
-                for index, addr_to_update in enumerate(changed_index):
-                    self.lx_hardware.set_eeprom_data_int(addr_to_update, int(
-                        self.previous_dict_data_list[addr_to_update]))
+    # number of config and presets bytes waiting to be written in the eeprom
+    def get_save_backlog(self):
+        backlog = self.config_journal.get_backlog() + self.preset_bank.get_backlog()
+        if self.need_save_data_in_file:
+            backlog = backlog + CONFIG_SIZE
+        return backlog
 
     def load_data(self):
         print("Start loading data")
 
-        eeprom_v_major = self.lx_hardware.get_eeprom_data_int(MAJOR_E_ADDR)
-        eeprom_v_minor = self.lx_hardware.get_eeprom_data_int(MINOR_E_ADDR)
-        eeprom_v_fix = self.lx_hardware.get_eeprom_data_int(FIX_E_ADDR)
+        # the newest config record is read at once (split by eeprom pages) then parsed from memory
+        image = bytearray(JOURNAL_IMAGE_MAX_SIZE)
+        journal_loaded = self.config_journal.load(image)
+        if journal_loaded:
+            # an older memory version can have more slots, that are now the preset bank, they are
+            # only scanned when the newest record found is of such a version
+            layout = find_config_layout(image[MAJOR_E_ADDR], image[MINOR_E_ADDR])
+            if layout is not None and layout.journal_slots > JOURNAL_SLOTS:
+                journal_loaded = self.config_journal.load(
+                    image, layout.journal_slots)
+        if not journal_loaded:
+            print("Info: no config journal, loading legacy config")
+        config_image = image
+        layout = None
+
+        eeprom_v_major = image[MAJOR_E_ADDR]
+        eeprom_v_minor = image[MINOR_E_ADDR]
+        eeprom_v_fix = image[FIX_E_ADDR]
         version_eeprom = f"v{eeprom_v_major}.{eeprom_v_minor}.{eeprom_v_fix}"
         print("version_eeprom", version_eeprom)
 
-        # only check major and minor and reset if they are different from "in memory" version
+        # check major and minor, migrate the config if its layout is known else reset it
         if self.v_minor is not eeprom_v_minor or self.v_major is not eeprom_v_major:
             version_main = f"v{self.v_major}.{self.v_minor}.{self.v_fix}"
-            print("Error: memory version is different",
+            layout = find_config_layout(eeprom_v_major, eeprom_v_minor)
+            if layout is None or (journal_loaded and layout.size != self.config_journal.loaded_size):
+                print("Error: memory version is different",
+                      version_main, version_eeprom)
+                print("Eeprom will be re-initialized, saving all data")
+                # the preset bank is formatted before the config of the current version is
+                # committed, else a power off in between would keep old slots as presets
+                self.__format_preset_bank(image, None)
+                self.save_data()
+                self.flush_save_data()
+                return
+            print("Warning: memory version is different, config is migrated",
                   version_main, version_eeprom)
-            print("Eeprom will be re-initialized, saving all data")
-            self.save_data()
+            config_image = self.__migrate_config_image(image, layout)
+            # presets of a layout without preset bank are moved to the bank before the migrated
+            # config is committed, after a power off in between the migration starts again from
+            # the newest old record still valid
+            if layout.presets > 0:
+                self.__format_preset_bank(image, layout)
+            # the migrated config is saved below
+            journal_loaded = False
         else:
             # check fix version number
             if self.v_fix is not eeprom_v_fix:
                 version_main = f"v{self.v_major}.{self.v_minor}.{self.v_fix}"
                 print("Warning: fix memory version is different. Fix changes are backward/forward compatible.",
                       version_main, version_eeprom)
-                # save fix version number
-                self.lx_hardware.set_eeprom_data_int(FIX_E_ADDR, self.v_fix)
+                # the fix version number is saved with the config below
+                journal_loaded = False
             else:
                 print(
                     "Info: main memory version number is the same as in eeprom", version_eeprom)
 
-            try:
-
-                eeprom_addr = [FIX_E_ADDR+1]
-
-                def incr_addr(a):
-                    a[0] += 1
-                    return a[0]-1
-
-                for euclidean_rhythm in self.euclidean_rhythms:
-
-                    euclidean_rhythm.beats = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-                    euclidean_rhythm.pulses = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-                    euclidean_rhythm.offset = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-                    euclidean_rhythm.pulses_probability = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-                    euclidean_rhythm.algo_index = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-                    euclidean_rhythm.prescaler_index = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-                    euclidean_rhythm.gate_length_ms = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-                    euclidean_rhythm.randomize_gate_length = bool(
-                        self.lx_hardware.get_eeprom_data_int(incr_addr(eeprom_addr)))
-                    euclidean_rhythm.burst_div_index = self.lx_hardware.get_eeprom_data_int(
-                        incr_addr(eeprom_addr))
-
-                for preset in self.presets:
-                    for preset_euclidean_rhythm in preset:
-                        preset_euclidean_rhythm.beats = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        preset_euclidean_rhythm.pulses = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        preset_euclidean_rhythm.offset = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        preset_euclidean_rhythm.pulses_probability = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        preset_euclidean_rhythm.algo_index = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        preset_euclidean_rhythm.prescaler_index = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        preset_euclidean_rhythm.gate_length_ms = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        preset_euclidean_rhythm.randomize_gate_length = bool(
-                            self.lx_hardware.get_eeprom_data_int(incr_addr(eeprom_addr)))
-                        preset_euclidean_rhythm.burst_div_index = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-
-                inner_rotate_action = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-                if inner_rotate_action >= LxEuclidConstant.CIRCLE_ACTION_NONE and inner_rotate_action <= LxEuclidConstant.CIRCLE_ACTION_BURST:
-                    self.inner_rotate_action = inner_rotate_action
-
-                inner_action_rhythm = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-                if inner_action_rhythm >= 0 and inner_action_rhythm <= 15:
-                    self.inner_action_rhythm = inner_action_rhythm
-
-                outer_rotate_action = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-                if outer_rotate_action >= LxEuclidConstant.CIRCLE_ACTION_NONE and outer_rotate_action <= LxEuclidConstant.CIRCLE_ACTION_BURST:
-                    self.outer_rotate_action = outer_rotate_action
-
-                outer_action_rhythm = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-                if outer_action_rhythm >= 0 and outer_action_rhythm <= 15:
-                    self.outer_action_rhythm = outer_action_rhythm
-
-                touch_sensitivity = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-                if touch_sensitivity >= 0 and touch_sensitivity <= 2:
-                    self.lx_hardware.capacitives_circles.touch_sensitivity = touch_sensitivity
-
-                clk_mode = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-                if clk_mode >= LxEuclidConstant.TAP_MODE and clk_mode <= LxEuclidConstant.CLK_IN:
-                    self.clk_mode = clk_mode
-
-                for cv_data in self.lx_hardware.cv_manager.cvs_data:
-                    for i in range(0, CvAction.CV_ACTION_LEN):
-
-                        cv_channel = self.lx_hardware.get_eeprom_data_int(
-                            incr_addr(eeprom_addr))
-                        if cv_channel >= CvChannel.CV_CHANNEL_NONE and cv_channel <= CvChannel.CV_CHANNEL_THREE:
-                            cv_data.set_cv_actions_channel(i, cv_channel)
-
-                # get back splitted tap tempo in lsb and msb
-                tap_tempo_lsb = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-                tap_tempo_msb = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-
-                tap_delay_ms = tap_tempo_lsb + (tap_tempo_msb << 8)
-
-                if tap_delay_ms <= LxEuclidConstant.MAX_TAP_DELAY_MS and tap_delay_ms >= LxEuclidConstant.MIN_TAP_DELAY_MS:
-                    self.tap_delay_ms = tap_delay_ms
-
-                flip = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-
-                if flip >= 0 and flip <= 1:
-                    self.flip = flip
-                preset_recall_mode = self.lx_hardware.get_eeprom_data_int(
-                    incr_addr(eeprom_addr))
-
-                if preset_recall_mode >= LxEuclidConstant.PRESET_RECALL_DIRECT_W_RESET and preset_recall_mode <= LxEuclidConstant.PRESET_INTERNAL_RESET:
-                    self.preset_recall_mode = preset_recall_mode
-
-                self.create_memory_dict()
-                self.previous_dict_data_list = list(self.dict_data.values())
-
-            except Exception as e:
-                print("Couldn't load eeprom config because unknown error")
-                print(e)
+        try:
+            addr = CONFIG_RHYTHMS_ADDR
+            for euclidean_rhythm in self.euclidean_rhythms:
+                load_config_fields(config_image, euclidean_rhythm,
+                                   RHYTHM_CONFIG_FIELDS, addr)
+                addr = addr + RHYTHM_CONFIG_SIZE
+
+            load_config_fields(config_image, self, CONFIG_FIELDS, 0)
+
+            addr = CONFIG_CV_ADDR
+            for cv_data in self.lx_hardware.cv_manager.cvs_data:
+                for i in range(0, CvAction.CV_ACTION_LEN):
+                    cv_channel = config_image[addr]
+                    if cv_channel >= CvChannel.CV_CHANNEL_NONE and cv_channel <= CvChannel.CV_CHANNEL_THREE:
+                        cv_data.set_cv_actions_channel(i, cv_channel)
+                    addr = addr + 1
+
+            # ignored values stay different from the saved record so they are fixed on next save
+            self.serialise_config()
+
+            # the legacy config, a migrated config or a different fix version is committed as a
+            # new record, only the bytes different from the slot content are written
+            if not journal_loaded:
+                self.save_data()
+                # a migrated config is committed at once, the preset bank is already formatted
+                if layout is not None:
+                    self.flush_save_data()
+
+        except Exception as e:
+            print("Couldn't load eeprom config because unknown error")
+            print(e)
+
+    # return the config of image migrated from layout to the current layout, in a single pass.
+    # Fields that didn't exist keep their current value
+    def __migrate_config_image(self, image, layout):
+        self.serialise_config()
+        migrated_image = bytearray(self.config_image)
+
+        for rhythm_index in range(0, len(self.euclidean_rhythms)):
+            self.__migrate_fields(image, layout.rhythm_fields, layout.rhythms_addr + rhythm_index*layout.rhythm_size,
+                                  migrated_image, RHYTHM_CONFIG_FIELDS, CONFIG_RHYTHMS_ADDR + rhythm_index*RHYTHM_CONFIG_SIZE)
+
+        self.__migrate_fields(image, layout.fields, 0,
+                              migrated_image, CONFIG_FIELDS, 0)
+
+        cv_actions = min(layout.cv_actions, CvAction.CV_ACTION_LEN)
+        for cv_index in range(0, len(self.lx_hardware.cv_manager.cvs_data)):
+            for i in range(0, cv_actions):
+                migrated_image[CONFIG_CV_ADDR + cv_index*CvAction.CV_ACTION_LEN +
+                               i] = image[layout.cv_addr + cv_index*layout.cv_actions + i]
+
+        if layout.migrate is not None:
+            layout.migrate(image, migrated_image)
+
+        return migrated_image
+
+    def __migrate_fields(self, image, old_fields, old_addr, migrated_image, fields, addr):
+        for name, offset, width, _, _ in fields:
+            old_field = find_config_field(old_fields, name)
+            if old_field is not None:
+                write_config_field(migrated_image, addr+offset, width, read_config_field(
+                    image, old_addr+old_field[1], old_field[2]))
+
+    # write the whole preset bank with the presets of image (layout) first, the others are
+    # erased and get back to their factory value
+    def __format_preset_bank(self, image, layout):
+        records = bytearray(
+            b"\xff"*(LxEuclidConstant.PRESETS_LEN*PRESET_RECORD_SIZE))
+        if layout is not None:
+            rhythms_len = len(self.euclidean_rhythms)
+            for preset_index in range(0, layout.presets):
+                for rhythm_index in range(0, rhythms_len):
+                    self.__migrate_fields(image, layout.rhythm_fields, layout.presets_addr + (preset_index*rhythms_len + rhythm_index)*layout.rhythm_size,
+                                          records, RHYTHM_CONFIG_FIELDS, preset_index*PRESET_RECORD_SIZE + rhythm_index*RHYTHM_CONFIG_SIZE)
+        self.preset_bank.format(records)
 
     def reload_rhythms(self):
         for euclidean_rhythm in self.euclidean_rhythms:
@@ -1902,65 +2248,150 @@ class LxEuclidConfig:
     def init_cvs_parameters(self):
         for i in range(0, 4):
             self.update_cvs_parameters([i, False])
+        self.update_cv_dirty_rhythms()
+
+    def __set_cv_dirty_rhythm(self, euclidean_rhythm_index):
+        if self.cv_dirty_rhythms & CV_RHYTHM_MASKS[euclidean_rhythm_index]:
+            self.cv_saved_regenerations = self.cv_saved_regenerations + 1
+        else:
+            self.cv_dirty_rhythms = self.cv_dirty_rhythms | CV_RHYTHM_MASKS[euclidean_rhythm_index]
+
+    # called once all CVs were read, return True if a rhythm was regenerated
+    def update_cv_dirty_rhythms(self):
+        if self.cv_dirty_rhythms == 0:
+            return False
+        for euclidean_rhythm_index, euclidean_rhythm in enumerate(self.euclidean_rhythms):
+            if self.cv_dirty_rhythms & CV_RHYTHM_MASKS[euclidean_rhythm_index]:
+                euclidean_rhythm.set_rhythm()
+        self.cv_dirty_rhythms = 0
+        # steps of a changed pattern are rolled again before the next clock comes
+        self.refill_gate_schedules()
+        return True
 
     def update_cvs_parameters(self, cv_data):
         to_return = False
         cv_channel = cv_data[0]  # the cv channel that changed
         rising_edge_detected = cv_data[1]
 
-        # cv_data is the array of 8
-        for euclidean_rhythm_index, cv_data in enumerate(self.lx_hardware.cv_manager.cvs_data):
-            for cv_action, cv_action_channel in enumerate(cv_data.cv_actions_channel):
-                if (cv_action_channel-1) == cv_channel:  # (cv_action_channel-1) because 0 = None
-                    to_return = True
-                    percent_value = self.lx_hardware.cv_manager.percent_values[cv_channel]
-                    if cv_action == CvAction.CV_ACTION_RESET and rising_edge_detected:
-                        self.euclidean_rhythms[euclidean_rhythm_index].reset_step(
-                        )
-                    elif cv_action == CvAction.CV_ACTION_BEATS:
-                        self.euclidean_rhythms[euclidean_rhythm_index].has_cv_beat = True
-                        self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_beat(
-                            percent_to_exp_percent(percent_value))
-                    elif cv_action == CvAction.CV_ACTION_PULSES:
-                        self.euclidean_rhythms[euclidean_rhythm_index].has_cv_pulse = True
-                        self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_pulse(
-                            percent_value)
-                    elif cv_action == CvAction.CV_ACTION_ROTATION:
-                        self.euclidean_rhythms[euclidean_rhythm_index].has_cv_offset = True
-                        self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_offset(
-                            percent_value)
-                    elif cv_action == CvAction.CV_ACTION_PROBABILITY:
-                        self.euclidean_rhythms[euclidean_rhythm_index].has_cv_prob = True
-                        self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_probability(
-                            percent_value)
-                    elif cv_action == CvAction.CV_ACTION_FILL:
-                        if percent_value > LOW_PERCENTAGE_RISING_THRESHOLD:
-                            self.euclidean_rhythms[euclidean_rhythm_index].fill(
-                            )
-                        else:
-                            self.euclidean_rhythms[euclidean_rhythm_index].unfill(
-                            )
-                    elif cv_action == CvAction.CV_ACTION_MUTE:
-                        if percent_value > LOW_PERCENTAGE_RISING_THRESHOLD:
-                            self.euclidean_rhythms[euclidean_rhythm_index].mute(
-                            )
-                        else:
-                            self.euclidean_rhythms[euclidean_rhythm_index].unmute(
-                            )
-                    elif cv_action == CvAction.CV_ACTION_BURST:
-                        if percent_value > LOW_PERCENTAGE_RISING_THRESHOLD:
-                            self.euclidean_rhythms[euclidean_rhythm_index].start_continue_burst(
-                                True)
-                        else:
-                            self.euclidean_rhythms[euclidean_rhythm_index].stop_burst_cv(
-                            )
+        cv_manager = self.lx_hardware.cv_manager
+        percent_value = cv_manager.percent_values[cv_channel]
+
+        # only the (rhythm, action) listening to this cv channel
+        for cv_route in cv_manager.cv_routes[cv_channel]:
+            to_return = True
+            euclidean_rhythm_index = cv_route >> CV_ROUTE_RHYTHM_SHIFT
+            cv_action = cv_route & CV_ROUTE_ACTION_MASK
+            if cv_action == CvAction.CV_ACTION_RESET and rising_edge_detected:
+                self.euclidean_rhythms[euclidean_rhythm_index].reset_step(
+                )
+            elif cv_action == CvAction.CV_ACTION_BEATS:
+                self.euclidean_rhythms[euclidean_rhythm_index].has_cv_beat = True
+                self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_beat(
+                    cv_manager.get_action_percent(cv_action, percent_value), False)
+                self.__set_cv_dirty_rhythm(euclidean_rhythm_index)
+            elif cv_action == CvAction.CV_ACTION_PULSES:
+                self.euclidean_rhythms[euclidean_rhythm_index].has_cv_pulse = True
+                self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_pulse(
+                    cv_manager.get_action_percent(cv_action, percent_value), False)
+                self.__set_cv_dirty_rhythm(euclidean_rhythm_index)
+            elif cv_action == CvAction.CV_ACTION_ROTATION:
+                self.euclidean_rhythms[euclidean_rhythm_index].has_cv_offset = True
+                self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_offset(
+                    cv_manager.get_action_percent(cv_action, percent_value), False)
+                self.__set_cv_dirty_rhythm(euclidean_rhythm_index)
+            elif cv_action == CvAction.CV_ACTION_PROBABILITY:
+                self.euclidean_rhythms[euclidean_rhythm_index].has_cv_prob = True
+                self.euclidean_rhythms[euclidean_rhythm_index].set_cv_percent_probability(
+                    cv_manager.get_action_percent(cv_action, percent_value))
+            elif cv_action == CvAction.CV_ACTION_FILL:
+                if percent_value > LOW_PERCENTAGE_RISING_THRESHOLD:
+                    self.euclidean_rhythms[euclidean_rhythm_index].fill(
+                    )
+                else:
+                    self.euclidean_rhythms[euclidean_rhythm_index].unfill(
+                    )
+            elif cv_action == CvAction.CV_ACTION_MUTE:
+                if percent_value > LOW_PERCENTAGE_RISING_THRESHOLD:
+                    self.euclidean_rhythms[euclidean_rhythm_index].mute(
+                    )
+                else:
+                    self.euclidean_rhythms[euclidean_rhythm_index].unmute(
+                    )
+            elif cv_action == CvAction.CV_ACTION_BURST:
+                if percent_value > LOW_PERCENTAGE_RISING_THRESHOLD:
+                    self.euclidean_rhythms[euclidean_rhythm_index].start_continue_burst(
+                        True)
+                    self.lx_hardware.start_burst_subdivisions()
+                else:
+                    self.euclidean_rhythms[euclidean_rhythm_index].stop_burst_cv(
+                    )
         return to_return
 
+    def load_cv_calibration(self):
+        data = self.lx_hardware.get_eeprom_data(
+            CV_CALIBRATION_E_ADDR, CV_CALIBRATION_SIZE)
+        if data[0] != CV_CALIBRATION_MAGIC or (sum(data[0:CV_CALIBRATION_SIZE-1]) & 0xFF) != data[CV_CALIBRATION_SIZE-1]:
+            # no calibration saved, keep the default one
+            return False
+        for channel in range(0, 4):
+            address = 1 + channel*4
+            raw_0v = data[address] | (data[address+1] << 8)
+            raw_5v = data[address+2] | (data[address+3] << 8)
+            self.lx_hardware.cv_manager.set_cv_calibration(
+                channel, raw_0v, raw_5v)
+        return True
+
+    def save_cv_calibration(self, raws_0v, raws_5v):
+        data = bytearray(CV_CALIBRATION_SIZE)
+        data[0] = CV_CALIBRATION_MAGIC
+        for channel in range(0, 4):
+            address = 1 + channel*4
+            data[address] = raws_0v[channel] & 0xFF
+            data[address+1] = (raws_0v[channel] >> 8) & 0xFF
+            data[address+2] = raws_5v[channel] & 0xFF
+            data[address+3] = (raws_5v[channel] >> 8) & 0xFF
+        data[CV_CALIBRATION_SIZE-1] = sum(data[0:CV_CALIBRATION_SIZE-1]) & 0xFF
+        self.lx_hardware.set_eeprom_data(CV_CALIBRATION_E_ADDR, data)
+
+    # each tap press in test mode does the next step of the cv calibration: all inputs at 0V,
+    # then all inputs at 5V, then the calibration is applied and saved
+    def cv_calibration_next_step(self):
+        if self.cv_calibration_step == CV_CALIBRATION_STEP_0V:
+            for channel in range(0, 4):
+                self.cv_calibration_0v[channel] = self.lx_hardware.get_cv_raw_average(
+                    channel)
+            self.cv_calibration_step = CV_CALIBRATION_STEP_5V
+        elif self.cv_calibration_step == CV_CALIBRATION_STEP_5V:
+            raws_5v = []
+            for channel in range(0, 4):
+                raws_5v.append(
+                    self.lx_hardware.get_cv_raw_average(channel))
+            self.cv_calibration_step = CV_CALIBRATION_STEP_SAVED
+            for channel in range(0, 4):
+                # 5V gives a smaller raw value than 0V
+                if self.cv_calibration_0v[channel] is None or raws_5v[channel] is None or self.cv_calibration_0v[channel] - raws_5v[channel] < CV_CALIBRATION_MIN_SPAN:
+                    self.cv_calibration_step = CV_CALIBRATION_STEP_ERROR
+            if self.cv_calibration_step == CV_CALIBRATION_STEP_SAVED:
+                for channel in range(0, 4):
+                    self.lx_hardware.cv_manager.set_cv_calibration(
+                        channel, self.cv_calibration_0v[channel], raws_5v[channel])
+                self.save_cv_calibration(self.cv_calibration_0v, raws_5v)
+        else:
+            # calibration can be done again
+            self.cv_calibration_step = CV_CALIBRATION_STEP_0V
+
     # function used to test the different peripheral of the module
     def test_mode(self):
         self.state = LxEuclidConstant.STATE_TEST
+        self.lx_hardware.cv_manager.set_sample_all_channels(True)
         counter = 0
+        btn_tap_pin_status = self.lx_hardware.btn_tap_pin.value()
         while True:
+            # tap press (pin goes low) drives the cv calibration
+            if btn_tap_pin_status != self.lx_hardware.btn_tap_pin.value():
+                btn_tap_pin_status = self.lx_hardware.btn_tap_pin.value()
+                if not btn_tap_pin_status:
+                    self.cv_calibration_next_step()
             for i in range(0, 4):
                 self.lx_hardware.sw_leds[i].value(
                     self.lx_hardware.btn_menu_pins[i].value())
@@ -1980,5 +2411,6 @@ class LxEuclidConfig:
                 self.lx_hardware.set_gate(2, 100)
             if (counter % 32) == 0:
                 self.lx_hardware.set_gate(3, 100)
+            self.lx_hardware.flush_gates()
 
             sleep(0.04)
@@ -1,9 +1,10 @@
 from _thread import allocate_lock
-from machine import Pin, I2C
+from machine import Pin, I2C, disable_irq, enable_irq
 from ucollections import deque
 from micropython import const
 import rp2
-from utime import ticks_us
+from utime import ticks_ms, ticks_us, ticks_diff, ticks_add
+from array import array
 
 from capacitivesCircles import CapacitivesCircles
 from cvManager import CvManager
@@ -24,6 +25,31 @@ LED_MENU = const(21)
 # equal 0.5hz equal 2sec period equal 2000ms
 LOWEST_CLK_IN_TENTH_MS = const(2000*10)
 
+# the clock period is the average of the last CLOCK_PERIODS_LEN periods kept with a running sum
+CLOCK_PERIODS_LEN = const(8)
+CLOCK_PERIODS_SHIFT = const(3)
+# a period more than 1/4 (2) away from the average is an outlier (missed or doubled pulse) and
+# is ignored, unless CLOCK_RELOCK_COUNT outliers in a row agree: the tempo changed
+CLOCK_OUTLIER_SHIFT = const(2)
+CLOCK_RELOCK_COUNT = const(3)
+
+# internal clock pll: each clock the phase error of the 24th subdivision is measured, the integral
+# (gain 1/4) compensates the time the interrupt adds to each subdivision and the proportional
+# (gain 1/2) brings the phase back while a burst runs
+PLL_INTEGRAL_SHIFT = const(2)
+PLL_PROPORTIONAL_SHIFT = const(1)
+# the integral is at most 1/8 of the clock period
+PLL_INTEGRAL_MAX_SHIFT = const(3)
+# the phase error average is a 1/8 exponential average
+PLL_ERROR_AVG_SHIFT = const(3)
+
+# periods (of a 24th of step) done by sm_internal_clock between two interrupts: every subdivision
+# while a burst runs, else once per step in tap mode. In clk in mode the input clock gives the
+# steps so the internal clock is stopped when no burst runs
+INTERNAL_CLOCK_STOPPED = const(0)
+INTERNAL_CLOCK_SUBDIVISION_REPEATS = const(1)
+INTERNAL_CLOCK_STEP_REPEATS = const(24)  # LxEuclidConstant.BURST_SUBDIVISION
+
 # this is external I2C SDA. We use it as internal clock until micropython fix mutlithreading issue with
 # pio, timer and schedule
 INTERNAL_CLOCK = const(26)
@@ -43,30 +69,84 @@ GATE_OUT_1 = const(3)
 GATE_OUT_2 = const(4)
 GATE_OUT_3 = const(5)
 
-ENDIANESS_EEPROM = const(1)
-
+# longest gate of a timeline, a duration is 8 bits
+GATE_MAX_MS = const(255)
+# a gate set again while high falls for this time then rises with the other gates of the step
+GATE_RETRIGGER_GAP_MS = const(1)  # the gap delays of gates_timeline last 1 ms
+# the four gates of a step are played by sm_gates as a timeline of two words: the retrigger gap
+# flag, the 4 bits gate states (the gap one first when there is a gap) and the first duration,
+# then three 8 bits durations. Words stay under 30 bits so they are small int
+GATES_GAP_FLAG = const(1)
+GATES_STATES_SHIFT = const(1)
+GATES_FIRST_DURATION_SHIFT = const(21)
+GATES_STATE_BITS = const(4)
+GATES_DURATION_BITS = const(8)
 
-@rp2.asm_pio(set_init=rp2.PIO.OUT_LOW, out_init=rp2.PIO.OUT_LOW, out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=24)
-def timed_10th_ms_pulse():
-    label("wait")
-    out(x, 16)
-    jmp(not_x, "wait")
-    set(pins, 1)
-    label("delay_high")
-    nop()
-    jmp(x_dec, "delay_high")
-    set(pins, 0)
+ENDIANESS_EEPROM = const(1)
 
 
-@rp2.asm_pio(set_init=rp2.PIO.OUT_LOW, out_init=rp2.PIO.OUT_LOW, out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=24)
+# at 80kHz, each state is kept for its duration in ms (80 cycles) before the next one is set.
+# Both words are pulled before any delay so the fifo is free again at once. Clearing y aborts the
+# timeline, it's checked about every 100us and the gates keep their state until the next
+# timeline. y is set before the last pull so an abort put after it is never lost
+@rp2.asm_pio(out_init=(rp2.PIO.OUT_LOW,)*4, out_shiftdir=rp2.PIO.SHIFT_RIGHT, in_shiftdir=rp2.PIO.SHIFT_RIGHT, pull_thresh=24)
+def gates_timeline():
+    wrap_target()
+    label("idle")
+    pull()
+    set(y, 1)
+    out(x, 1)
+    out(isr, 20)
+    jmp(not_x, "no_gap")
+    out(x, 8)
+    pull()
+    mov(pins, isr)
+    in_(null, 4)
+    jmp(not_y, "idle")[25]
+    jmp(not_y, "idle")[25]
+    jmp(not_y, "idle")[24]
+    jmp("segment")
+    label("no_gap")
+    out(x, 8)
+    pull()
+    label("segment")
+    mov(pins, isr)
+    in_(null, 4)
+    label("delay")
+    jmp(not_x, "next")
+    jmp(not_y, "idle")[8]
+    jmp(not_y, "idle")[8]
+    jmp(not_y, "idle")[8]
+    jmp(not_y, "idle")[8]
+    jmp(not_y, "idle")[8]
+    jmp(not_y, "idle")[8]
+    jmp(not_y, "idle")[8]
+    jmp(not_y, "idle")[8]
+    jmp(x_dec, "delay")[6]
+    label("next")
+    jmp(not_osre, "load")
+    mov(pins, null)
+    wrap()
+    label("load")
+    out(x, 8)
+    jmp("segment")
+
+
+# word: number of periods - 1 (16 msb), period (16 lsb)
+@rp2.asm_pio(set_init=rp2.PIO.OUT_LOW, out_init=rp2.PIO.OUT_LOW, out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=32)
 def timed_10th_ms_pulse_internal_clock():
     label("wait")
+    out(y, 16)
     out(x, 16)
     jmp(not_x, "wait")
+    mov(isr, x)
     set(pins, 0)
+    label("repeat")
     label("delay_high")
     nop()
     jmp(x_dec, "delay_high")
+    mov(x, isr)
+    jmp(y_dec, "repeat")
     set(pins, 1)
 
 
@@ -140,9 +220,11 @@ class LxHardware:
 
         self.internal_clk_pin.irq(handler=self.internal_clk_pin_change,
                                   trigger=Pin.IRQ_RISING, hard=True)
-        # this sm_internal_clock goes 24 time faster than the clock to handle burst
+        # this sm_internal_clock goes up to 24 time faster than the clock to handle burst
         # clk_subdivision_counter handle this 24 time division
         self.clk_subdivision_counter = 0
+        # periods of the running sm_internal_clock word
+        self.internal_clock_repeats = INTERNAL_CLOCK_STOPPED
 
         self.clk_pin.irq(handler=self.clk_pin_change,
                          trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, hard=True)
@@ -190,21 +272,24 @@ class LxHardware:
         self.led_menu.value(0)
         self.led_tap.value(0)
 
-        self.sm0 = rp2.StateMachine(0, timed_10th_ms_pulse, freq=20_000, set_base=Pin(
-            GATE_OUT_0), out_base=Pin(GATE_OUT_0))
-        self.sm1 = rp2.StateMachine(1, timed_10th_ms_pulse, freq=20_000, set_base=Pin(
-            GATE_OUT_1), out_base=Pin(GATE_OUT_1))
-        self.sm2 = rp2.StateMachine(2, timed_10th_ms_pulse, freq=20_000, set_base=Pin(
-            GATE_OUT_2), out_base=Pin(GATE_OUT_2))
-        self.sm3 = rp2.StateMachine(3, timed_10th_ms_pulse, freq=20_000, set_base=Pin(
-            GATE_OUT_3), out_base=Pin(GATE_OUT_3))
-
-        self.sms = [self.sm0, self.sm1, self.sm2, self.sm3]
-
-        self.sm0.active(1)
-        self.sm1.active(1)
-        self.sm2.active(1)
-        self.sm3.active(1)
+        # GATE_OUT_0 to GATE_OUT_3 are driven together so the gates of a step rise at once
+        self.sm_gates = rp2.StateMachine(
+            0, gates_timeline, freq=80_000, out_base=Pin(GATE_OUT_0))
+        self.sm_gates.active(1)
+        # encoded once, exec of an int doesn't create memory in interrupt
+        self.gates_abort_instruction = rp2.asm_pio_encode("set(y, 0)", 0)
+
+        # gates of the current step, time where each gate falls, gates sorted by remaining time
+        self.gates_pending_ms = bytearray(4)
+        self.gates_end_ms = array("i", [ticks_ms()]*4)
+        self.gates_remaining_ms = bytearray(4)
+        self.gates_order = bytearray(4)
+        # per gate, hits merged with another hit of the same step, hits delayed to the next flush
+        # because sm_gates had not loaded the previous timeline yet and hits that retriggered a
+        # gate still high
+        self.gates_merged_hits = array("i", [0]*4)
+        self.gates_delayed_hits = array("i", [0]*4)
+        self.gates_retriggered_hits = array("i", [0]*4)
 
         # for a 10th ms pulse clk should be 20_000
         # but we do a 24subdivider pulse for burst so we up the freq to 480_000
@@ -229,12 +314,31 @@ class LxHardware:
 
         self.lx_euclid_config = None
 
-        self.last_clock_ticks_tenth_ms = 0
-        self.clock_period_accumulator = 0
+        self.last_clock_ticks_us = ticks_us()
         self.clock_period_avg_tenth_ms = LOWEST_CLK_IN_TENTH_MS
-        self.last_clock_periods = deque((), 8)
-        for i in range(0, 8):
-            self.last_clock_periods.append(LOWEST_CLK_IN_TENTH_MS)
+        self.clock_periods = array(
+            "i", [LOWEST_CLK_IN_TENTH_MS]*CLOCK_PERIODS_LEN)
+        self.clock_periods_sum = LOWEST_CLK_IN_TENTH_MS*CLOCK_PERIODS_LEN
+        self.clock_periods_index = 0
+        # no period measured yet, the first one is taken as the tempo
+        self.clock_period_locked = False
+        # consecutive outliers and the last one, used to relock on a new tempo
+        self.clock_outliers_count = 0
+        self.clock_last_outlier_tenth_ms = 0
+        # number of periods rejected and of relocks, for debug purpose
+        self.clock_rejected_periods = 0
+        self.clock_relocks = 0
+
+        # period put in sm_internal_clock in CLK_IN mode, corrected by the pll
+        self.internal_clock_period_tenth_ms = LOWEST_CLK_IN_TENTH_MS
+        # internal clock ticks since the last clock, time of the last one
+        self.internal_ticks_since_clock = 0
+        self.last_internal_tick_us = ticks_us()
+        self.pll_integral_us = 0
+        # last phase error of the 24th subdivision against the clock (positive when late) and
+        # average of its absolute value, in us
+        self.clock_phase_error_us = 0
+        self.clock_phase_error_avg_us = 0
 
     def set_lx_euclid_config(self, lx_euclid_config):
         self.lx_euclid_config = lx_euclid_config
@@ -245,8 +349,36 @@ class LxHardware:
 
     def stop_internal_clk(self):
         self.sm_internal_clock.restart()
+        self.internal_clock_repeats = INTERNAL_CLOCK_STOPPED
+
+    # called by the main loop once a burst is engaged. In tap mode without burst the running
+    # word lasts a whole step, it is replaced by one ending on the next subdivision so the burst
+    # starts there and not up to a step later
+    def start_burst_subdivisions(self):
+        irq_state = disable_irq()
+        if self.internal_clock_repeats == INTERNAL_CLOCK_STEP_REPEATS:
+            subdivision_us = (self.lx_euclid_config.tap_delay_ms *
+                              1000)//LxEuclidConstant.BURST_SUBDIVISION
+            elapsed_us = ticks_diff(ticks_us(), self.last_internal_tick_us)
+            # subdivisions done by the step word when it reaches the next one
+            repeats = elapsed_us//subdivision_us + 1
+            if repeats < INTERNAL_CLOCK_STEP_REPEATS:
+                # a period of sm_internal_clock is 1/24 of a 10th of ms
+                period = ((repeats*subdivision_us - elapsed_us)
+                          * LxEuclidConstant.BURST_SUBDIVISION)//100
+                if period < 1:
+                    period = 1
+                self.sm_internal_clock.restart()
+                self.sm_internal_clock.put(period)
+                self.clk_subdivision_counter = (self.clk_subdivision_counter - INTERNAL_CLOCK_STEP_REPEATS + repeats) % (
+                    LxEuclidConstant.BURST_SUBDIVISION*LxEuclidConstant.PRESCALER_LIST[-1])
+                self.internal_clock_repeats = repeats
+        enable_irq(irq_state)
 
     def internal_clk_pin_change(self, pin):
+        self.internal_ticks_since_clock = self.internal_ticks_since_clock + \
+            self.internal_clock_repeats
+        self.last_internal_tick_us = ticks_us()
 
         if self.lx_euclid_config.incr_burst_steps(self.clk_subdivision_counter):
             self.lxHardwareEventFifo.append(self.clk_burst_rise_event)
@@ -256,19 +388,38 @@ class LxHardware:
                 self.lx_euclid_config.incr_steps()
                 self.lxHardwareEventFifo.append(self.clk_rise_event)
             # relauch only when using tap mode
-        #
-        # we are using 16 bit on the SM
-        # --> 2**16/10/1000 = 6.5536 s
+
+        # the rate only changes on a step so the subdivisions stay in phase with the steps. Gates
+        # that sm_gates couldn't take yet are flushed by the next subdivision
+        subdivisions_needed = self.lx_euclid_config.is_any_burst_running() or self.is_gate_pending()
         if self.lx_euclid_config.clk_mode == LxEuclidConstant.TAP_MODE:
-            self.sm_internal_clock.put(self.lx_euclid_config.tap_delay_ms*10)
+            if subdivisions_needed or self.clk_subdivision_counter % LxEuclidConstant.BURST_SUBDIVISION != 0:
+                repeats = INTERNAL_CLOCK_SUBDIVISION_REPEATS
+            else:
+                repeats = INTERNAL_CLOCK_STEP_REPEATS
+        elif subdivisions_needed:
+            repeats = INTERNAL_CLOCK_SUBDIVISION_REPEATS
         else:
-            self.sm_internal_clock.put(self.clock_period_avg_tenth_ms)
+            # the input clock gives the steps and restarts the subdivisions of a burst
+            repeats = INTERNAL_CLOCK_STOPPED
+        self.internal_clock_repeats = repeats
+        if repeats != INTERNAL_CLOCK_STOPPED:
+            #
+            # we are using 16 bit on the SM
+            # --> 2**16/10/1000 = 6.5536 s
+            if self.lx_euclid_config.clk_mode == LxEuclidConstant.TAP_MODE:
+                period_tenth_ms = self.lx_euclid_config.tap_delay_ms*10
+            else:
+                period_tenth_ms = self.internal_clock_period_tenth_ms
+            self.sm_internal_clock.put(((repeats-1) << 16) | period_tenth_ms)
 
-        # 24 --> smallest common multiplier of burst (LxEuclidConstant.BURST_SUBDIVISION)
-        # *
-        # 16 --> biggest clock divider (LxEuclidConstant.PRESCALER_LIST[-1])
-        self.clk_subdivision_counter = (
-            self.clk_subdivision_counter + 1) % (LxEuclidConstant.BURST_SUBDIVISION*LxEuclidConstant.PRESCALER_LIST[-1])
+            # 24 --> smallest common multiplier of burst (LxEuclidConstant.BURST_SUBDIVISION)
+            # *
+            # 16 --> biggest clock divider (LxEuclidConstant.PRESCALER_LIST[-1])
+            self.clk_subdivision_counter = (
+                self.clk_subdivision_counter + repeats) % (LxEuclidConstant.BURST_SUBDIVISION*LxEuclidConstant.PRESCALER_LIST[-1])
+
+        self.flush_gates()
 
     def clk_pin_change(self, pin):
         try:
@@ -278,32 +429,132 @@ class LxHardware:
             self.clk_pin_status = self.clk_pin.value()
             if not self.clk_pin.value():
                 if self.lx_euclid_config is not None:
-                    temp_ticks_tenth_ms = ticks_us()//100
-                    if temp_ticks_tenth_ms-self.last_clock_ticks_tenth_ms > (LOWEST_CLK_IN_TENTH_MS):
-                        self.last_clock_periods.append(LOWEST_CLK_IN_TENTH_MS)
-                    else:
-                        self.last_clock_periods.append(
-                            temp_ticks_tenth_ms-self.last_clock_ticks_tenth_ms)
-                    self.last_clock_ticks_tenth_ms = temp_ticks_tenth_ms
-
-                    self.clock_period_accumulator = 0
-                    for i in range(0, 8):
-                        self.clock_period_accumulator += self.last_clock_periods[i]
-                    # ceil div by 8 since we have 8 element in the last_clock_periods deque
-                    self.clock_period_avg_tenth_ms = self.clock_period_accumulator // 8
+                    temp_ticks_us = ticks_us()
+                    period_tenth_ms = ticks_diff(
+                        temp_ticks_us, self.last_clock_ticks_us)//100
+                    self.last_clock_ticks_us = temp_ticks_us
+                    # a longer period is the clock starting again, it says nothing about the tempo
+                    clock_running = period_tenth_ms <= LOWEST_CLK_IN_TENTH_MS
+                    if clock_running:
+                        self.update_clock_period(period_tenth_ms)
 
                     if self.lx_euclid_config.clk_mode == LxEuclidConstant.CLK_IN:
                         self.lx_euclid_config.incr_steps()
                         # resync the burst to the input clock
                         self.lx_euclid_config.test_start_burst()
-                        if not self.lx_euclid_config.is_any_burst_running():
+                        burst_running = self.lx_euclid_config.is_any_burst_running()
+                        subdivisions_running = self.internal_clock_repeats == INTERNAL_CLOCK_SUBDIVISION_REPEATS
+                        if subdivisions_running and clock_running:
+                            self.update_internal_clock_pll(
+                                temp_ticks_us, burst_running)
+                        else:
+                            # the integral (interrupt latency) is kept, there is no phase error
+                            # since the subdivisions start on this clock
+                            self.update_internal_clock_period(0)
+                        if not burst_running:
+                            self.flush_gates()
+                        # the internal clock is only needed by the bursts and to flush the gates
+                        # sm_gates couldn't take yet
+                        if burst_running or self.is_gate_pending():
+                            if not subdivisions_running:
+                                self.stop_internal_clk()
+                                self.clk_subdivision_counter = 0
+                                self.relaunch_internal_clk()
+                                # the subdivisions start from this clock
+                                self.internal_ticks_since_clock = 0
+                                self.last_internal_tick_us = temp_ticks_us
+                        else:
                             self.stop_internal_clk()
                             self.clk_subdivision_counter = 0
-                            self.relaunch_internal_clk()
+                        self.flush_gates()
             self.lxHardwareEventFifo.append(self.clk_rise_event)
         except Exception as e:
             print(e)
 
+    # O(1) running average of the clock periods, called in interrupt so no memory is created
+    def update_clock_period(self, period_tenth_ms):
+        avg_tenth_ms = self.clock_period_avg_tenth_ms
+        if abs(period_tenth_ms - avg_tenth_ms) > (avg_tenth_ms >> CLOCK_OUTLIER_SHIFT):
+            if self.clock_outliers_count > 0 and abs(period_tenth_ms - self.clock_last_outlier_tenth_ms) <= (self.clock_last_outlier_tenth_ms >> CLOCK_OUTLIER_SHIFT):
+                self.clock_outliers_count = self.clock_outliers_count + 1
+            else:
+                self.clock_outliers_count = 1
+            self.clock_last_outlier_tenth_ms = period_tenth_ms
+
+            if self.clock_outliers_count < CLOCK_RELOCK_COUNT and self.clock_period_locked:
+                self.clock_rejected_periods = self.clock_rejected_periods + 1
+                return
+            # the tempo changed, restart the average from the new period
+            for i in range(0, CLOCK_PERIODS_LEN):
+                self.clock_periods[i] = period_tenth_ms
+            self.clock_periods_sum = period_tenth_ms*CLOCK_PERIODS_LEN
+            self.clock_period_avg_tenth_ms = period_tenth_ms
+            self.clock_relocks = self.clock_relocks + 1
+            self.clock_outliers_count = 0
+            self.clock_period_locked = True
+            return
+
+        self.clock_outliers_count = 0
+        self.clock_period_locked = True
+        index = self.clock_periods_index
+        self.clock_periods_sum = self.clock_periods_sum + \
+            period_tenth_ms - self.clock_periods[index]
+        self.clock_periods[index] = period_tenth_ms
+        self.clock_periods_index = (index + 1) % CLOCK_PERIODS_LEN
+        self.clock_period_avg_tenth_ms = self.clock_periods_sum >> CLOCK_PERIODS_SHIFT
+
+    # called in interrupt on each clock, compute the internal clock period of the next clock
+    def update_internal_clock_pll(self, clock_ticks_us, burst_running):
+        subdivision_us = (self.internal_clock_period_tenth_ms *
+                          100) // LxEuclidConstant.BURST_SUBDIVISION
+        ticks = self.internal_ticks_since_clock
+        elapsed_us = ticks_diff(clock_ticks_us, self.last_internal_tick_us)
+        # when was (or will be) the 24th subdivision compared to this clock
+        if ticks >= LxEuclidConstant.BURST_SUBDIVISION:
+            error_us = -elapsed_us - \
+                (ticks - LxEuclidConstant.BURST_SUBDIVISION)*subdivision_us
+        else:
+            error_us = (LxEuclidConstant.BURST_SUBDIVISION -
+                        ticks)*subdivision_us - elapsed_us
+        # the subdivisions late of this clock are still counted for the next one
+        self.internal_ticks_since_clock = ticks - LxEuclidConstant.BURST_SUBDIVISION
+
+        period_us = self.clock_period_avg_tenth_ms*100
+        if error_us > period_us:
+            error_us = period_us
+        elif error_us < -period_us:
+            error_us = -period_us
+        self.clock_phase_error_us = error_us
+        self.clock_phase_error_avg_us = self.clock_phase_error_avg_us + \
+            ((abs(error_us) - self.clock_phase_error_avg_us) >> PLL_ERROR_AVG_SHIFT)
+
+        self.pll_integral_us = self.pll_integral_us + \
+            (error_us >> PLL_INTEGRAL_SHIFT)
+        if burst_running:
+            self.update_internal_clock_period(
+                error_us >> PLL_PROPORTIONAL_SHIFT)
+        else:
+            self.update_internal_clock_period(0)
+
+    # called in interrupt on each clock, the internal clock period follows the clock period even
+    # when the subdivisions don't run so a burst starts with the right period
+    def update_internal_clock_period(self, phase_correction_us):
+        integral_max_us = (self.clock_period_avg_tenth_ms *
+                           100) >> PLL_INTEGRAL_MAX_SHIFT
+        if self.pll_integral_us > integral_max_us:
+            self.pll_integral_us = integral_max_us
+        elif self.pll_integral_us < -integral_max_us:
+            self.pll_integral_us = -integral_max_us
+
+        # one tenth of ms more in the period makes the 24 subdivisions 100us longer
+        correction_us = self.pll_integral_us + phase_correction_us
+        period_tenth_ms = self.clock_period_avg_tenth_ms - correction_us//100
+        if period_tenth_ms < 1:
+            period_tenth_ms = 1
+        elif period_tenth_ms > 0xFFFF:
+            period_tenth_ms = 0xFFFF
+        self.internal_clock_period_tenth_ms = period_tenth_ms
+
     def rst_pin_change(self, pin):
         if self.rst_pin_status == self.rst_pin.value():
             return
@@ -368,12 +619,114 @@ class LxHardware:
             else:
                 self.sw_leds[index].value(0)
 
-    def set_gate(self, gate_index, time_tenth_ms):
+    # the gate rises with the other gates of the step when flush_gates is called
+    def set_gate(self, gate_index, gate_length_ms):
         if gate_index < 4:
-            time = time_tenth_ms * 10
-            # test if we are ready to start a new gate with the PIO (not currently having a gate out)
-            if self.sms[gate_index].tx_fifo() == 0:
-                self.sms[gate_index].put(time)
+            # the gap of a retrigger must fit in the timeline too
+            if gate_length_ms > GATE_MAX_MS - GATE_RETRIGGER_GAP_MS:
+                gate_length_ms = GATE_MAX_MS - GATE_RETRIGGER_GAP_MS
+            if self.gates_pending_ms[gate_index]:
+                self.gates_merged_hits[gate_index] = self.gates_merged_hits[gate_index] + 1
+            if gate_length_ms > self.gates_pending_ms[gate_index]:
+                self.gates_pending_ms[gate_index] = gate_length_ms
+
+    # this function doesn't allocate any memory
+    def is_gate_pending(self):
+        pending_ms = self.gates_pending_ms
+        return (pending_ms[0] | pending_ms[1] | pending_ms[2] | pending_ms[3]) != 0
+
+    # called at the end of the interrupts, this function doesn't allocate any memory. The timeline
+    # of the gates still high is replaced by one with the new gates, a gate still high when it's
+    # set again is retriggered: sm_gates keeps it low for GATE_RETRIGGER_GAP_MS then it rises
+    # for its new length
+    def flush_gates(self):
+        pending_ms = self.gates_pending_ms
+        if not (pending_ms[0] or pending_ms[1] or pending_ms[2] or pending_ms[3]):
+            return
+        # two flushes can follow each other (clock and internal clock interrupts), the previous
+        # timeline must be loaded else the abort could be lost. The pending gates stay for the next
+        # flush, the internal clock runs until then
+        if self.sm_gates.tx_fifo():
+            for gate_index in range(0, 4):
+                if pending_ms[gate_index]:
+                    self.gates_delayed_hits[gate_index] = self.gates_delayed_hits[gate_index] + 1
+            return
+
+        now_ms = ticks_ms()
+        remaining_ms = self.gates_remaining_ms
+        order = self.gates_order
+        high_gates = 0
+        retriggered_gates = 0
+        for gate_index in range(0, 4):
+            gate_remaining_ms = ticks_diff(
+                self.gates_end_ms[gate_index], now_ms)
+            # a fall older than the ticks_ms half period looks like a future one
+            if gate_remaining_ms <= 0 or gate_remaining_ms > GATE_MAX_MS:
+                gate_remaining_ms = 0
+            else:
+                high_gates |= 1 << gate_index
+                if pending_ms[gate_index]:
+                    retriggered_gates |= 1 << gate_index
+                    self.gates_retriggered_hits[gate_index] = self.gates_retriggered_hits[gate_index] + 1
+            remaining_ms[gate_index] = gate_remaining_ms
+        if retriggered_gates:
+            gap_ms = GATE_RETRIGGER_GAP_MS
+        else:
+            gap_ms = 0
+
+        for gate_index in range(0, 4):
+            if pending_ms[gate_index]:
+                gate_remaining_ms = pending_ms[gate_index]
+                self.gates_end_ms[gate_index] = ticks_add(
+                    now_ms, gap_ms + gate_remaining_ms)
+                pending_ms[gate_index] = 0
+            elif remaining_ms[gate_index] > gap_ms:
+                gate_remaining_ms = remaining_ms[gate_index] - gap_ms
+            else:
+                gate_remaining_ms = 0
+            remaining_ms[gate_index] = gate_remaining_ms
+
+            # insertion of the gate in order
+            position = gate_index
+            while position > 0 and remaining_ms[order[position-1]] > gate_remaining_ms:
+                order[position] = order[position-1]
+                position = position - 1
+            order[position] = gate_index
+
+        state = 0
+        for gate_index in range(0, 4):
+            if remaining_ms[gate_index]:
+                state |= 1 << gate_index
+        states = state
+        first_duration_ms = 0
+        durations = 0
+        segment = 0
+        elapsed_ms = 0
+        for position in range(0, 4):
+            gate_index = order[position]
+            if remaining_ms[gate_index] == 0:
+                continue
+            if segment == 0:
+                first_duration_ms = remaining_ms[gate_index]
+            else:
+                durations |= (remaining_ms[gate_index] -
+                              elapsed_ms) << ((segment-1)*GATES_DURATION_BITS)
+            elapsed_ms = remaining_ms[gate_index]
+            state &= ~(1 << gate_index)
+            segment = segment + 1
+            states |= state << (segment*GATES_STATE_BITS)
+
+        if gap_ms:
+            states = (states << GATES_STATE_BITS) | (
+                high_gates & ~retriggered_gates)
+            gap_flag = GATES_GAP_FLAG
+        else:
+            gap_flag = 0
+        if high_gates:
+            self.sm_gates.exec(self.gates_abort_instruction)
+        self.sm_gates.put(gap_flag | (states << GATES_STATES_SHIFT) |
+                          (first_duration_ms << GATES_FIRST_DURATION_SHIFT))
+        self.sm_gates.put(durations)
 
     def set_tap_led(self):
         self.led_tap.value(1)
@@ -431,6 +784,24 @@ class LxHardware:
         self.i2c_lock.release()
         return to_return
 
+    # blocking average of a cv input raw value, used by the cv calibration
+    def get_cv_raw_average(self, channel):
+        self.i2c_lock.acquire()
+        to_return = self.cv_manager.read_raw_average(channel)
+        self.i2c_lock.release()
+        return to_return
+
+    def get_eeprom_data(self, address, size):
+        self.i2c_lock.acquire()
+        raw_data = self.eeprom_memory[address:address+size]
+        self.i2c_lock.release()
+        return raw_data
+
+    def set_eeprom_data(self, address, data):
+        self.i2c_lock.acquire()
+        self.eeprom_memory[address:address+len(data)] = data
+        self.i2c_lock.release()
+
     def get_eeprom_data_int(self, address):
         self.i2c_lock.acquire()
         raw_data = self.eeprom_memory[address:address+1]
@@ -9,7 +9,7 @@ FIX = 0
 ADD = ""
 
 MEMORY_MAJOR = 1
-MEMORY_MINOR = 1
+MEMORY_MINOR = 2
 MEMORY_FIX = 0
 
 VERSION = f"v{MAJOR}.{MINOR}.{FIX}{ADD}"
@@ -69,7 +69,6 @@ def lxhardware_changed(handlerEventData):
     if event == lx_hardware.CLK_RISE or event == lx_hardware.BURST_CLK_RISE:
         if lx_euclid_config.state in [LxEuclidConstant.STATE_RHYTHM_PARAM_INNER_OFFSET_PROBABILITY, LxEuclidConstant.STATE_RHYTHM_PARAM_INNER_BEAT_PULSE, LxEuclidConstant.STATE_LIVE]:
             LCD.set_need_display()
-        lx_euclid_config.random_gate_length_update()
     elif event == lx_hardware.RST_RISE:
         if lx_euclid_config.preset_recall_ext_reset:
             lx_euclid_config.delegate_load_preset()
@@ -183,6 +182,9 @@ def lxhardware_changed(handlerEventData):
                 lx_euclid_config.on_event(LxEuclidConstant.EVENT_MENU_BTN)
             LCD.set_need_display()
 
+    # steps consumed by the clock or changed by the event are rolled again at once
+    lx_euclid_config.refill_gate_schedules()
+
 
 def display_thread():
     global last_capacitive_circles_read_ms
@@ -287,6 +289,11 @@ if __name__ == '__main__':
                         has_cvs_changed)
                     if need_lcd_update:
                         LCD.set_need_display()
+                        # mute and fill change the pattern at once
+                        lx_euclid_config.refill_gate_schedules()
+                if lx_hardware.cv_manager.is_round_completed():
+                    if lx_euclid_config.update_cv_dirty_rhythms():
+                        LCD.set_need_display()
 
         print("quit")
     except Exception as e:
@@ -0,0 +1,201 @@
+from array import array
+from micropython import const
+
+MAX_BEATS = const(32)
+
+ALGO_EUCLIDEAN = const(0)
+ALGO_EXPONENTIAL = const(1)
+ALGO_INVERTED_EXPONENTIAL = const(2)
+ALGO_SYMMETRIC_EXPONENTIAL = const(3)
+ALGO_LEN = const(4)
+
+# number of (beats, pulses) couples for one algo: sum of (beats+1) for beats in 1..MAX_BEATS
+PATTERNS_PER_ALGO = const(560)
+
+# a pattern is packed in a 32 bits word where bit n is the step n. Micropython small int are
+# only 31 bits, reading a 32 bits word would create memory (long int) so each pattern is stored
+# as two 16 bits halves: low half (steps 0..15) then high half (steps 16..31)
+PATTERN_HALF_BITS = const(16)
+
+
+# index of the low half of a pattern in PATTERN_TABLE, high half is at index+1
+def pattern_index(algo_index, beats, pulses):
+    return (algo_index*PATTERNS_PER_ALGO + (((beats-1)*(beats+2)) >> 1) + pulses) << 1
+
+
+# this function can be called by an interrupt, it doesn't allocate any memory
+def get_pattern_step(pattern_low, pattern_high, step):
+    if step < PATTERN_HALF_BITS:
+        return (pattern_low >> step) & 1
+    return (pattern_high >> (step - PATTERN_HALF_BITS)) & 1
+
+
+# rotate a pattern of beats steps by offset and return one of its halves (0 low, 1 high)
+# rotated step n is the pattern step (n - offset) so the interrupt doesn't need any modulo
+def rotate_pattern_half(pattern_low, pattern_high, beats, offset, half):
+    rotated_half = 0
+    first_step = half*PATTERN_HALF_BITS
+    for step in range(first_step, min(beats, first_step+PATTERN_HALF_BITS)):
+        if get_pattern_step(pattern_low, pattern_high, (step - offset) % beats):
+            rotated_half |= 1 << (step - first_step)
+    return rotated_half
+
+
+# preallocated buffers of the bjorklund generator, it never needs more than MAX_BEATS levels
+_bjorklund_counts = bytearray(MAX_BEATS)
+_bjorklund_remainders = bytearray(MAX_BEATS)
+# every stacked level produces at least one step so the stack never holds more than MAX_BEATS
+_bjorklund_stack = bytearray(MAX_BEATS)
+
+
+# non recursive version of https://github.com/brianhouse/bjorklund/tree/master with the same
+# output. Levels are unstacked from a preallocated buffer instead of a recursive closure and steps
+# are directly written as bits, no list is created. Pulses must be between 2 and beats-1
+def set_bjorklund_pattern(table, index, beats, pulses):
+    counts = _bjorklund_counts
+    remainders = _bjorklund_remainders
+    stack = _bjorklund_stack
+
+    divisor = beats - pulses
+    remainders[0] = pulses
+    level = 0
+    while True:
+        counts[level] = divisor // remainders[level]
+        remainders[level+1] = divisor % remainders[level]
+        divisor = remainders[level]
+        level = level + 1
+        if remainders[level] <= 1:
+            break
+    counts[level] = divisor
+
+    # stacked levels are shifted by 2, level -1 is a 0 step and level -2 a 1 step
+    stack[0] = level + 2
+    stack_size = 1
+    step = 0
+    first_pulse = -1
+    pattern_low = 0
+    pattern_high = 0
+    while stack_size > 0:
+        stack_size = stack_size - 1
+        level = stack[stack_size] - 2
+        if level < 0:
+            if level == -2:
+                # pattern starts on its first pulse, steps before it are 0 and go at the end
+                if first_pulse == -1:
+                    first_pulse = step
+                rotated_step = step - first_pulse
+                if rotated_step < PATTERN_HALF_BITS:
+                    pattern_low |= 1 << rotated_step
+                else:
+                    pattern_high |= 1 << (rotated_step - PATTERN_HALF_BITS)
+            step = step + 1
+        else:
+            # pushed in reverse order: counts[level] times level-1 then level-2
+            if remainders[level] != 0:
+                stack[stack_size] = level
+                stack_size = stack_size + 1
+            count = counts[level]
+            while count > 0:
+                stack[stack_size] = level + 1
+                stack_size = stack_size + 1
+                count = count - 1
+
+    table[index] = pattern_low
+    table[index+1] = pattern_high
+
+
+def exponential_rhythm(beats, pulses, reverse=False):
+    if pulses == 0:
+        return [0]*beats
+    elif pulses == 1:
+        return [1]*1+[0]*(beats-1)
+    else:
+        alpha = 1.4
+
+        # Calculate the exponential positions
+        positions = [round((i / (pulses - 1))**alpha * (beats - 1))
+                     for i in range(pulses)]
+
+        # Make sure all positions are unique
+        positions = list(set(positions))
+
+        # If fewer unique positions than k, fill in the gaps
+        while len(positions) < pulses:
+            for i in range(1, beats):
+                if i not in positions:
+                    positions.append(i)
+                if len(positions) >= pulses:
+                    break
+
+        # Create the rhythm array
+        rhythm = [0] * beats
+        for pos in positions:
+            rhythm[pos] = 1
+        if reverse:
+            return list(reversed(rhythm))
+        else:
+            return rhythm
+
+
+def symmetric_exponential_rhythm(beats, pulses):
+
+    if beats % 2 == 1:
+        rhythm0_n = int(beats/2)
+        rhythm1_n = rhythm0_n+1
+    else:
+        rhythm0_n = int(beats/2)
+        rhythm1_n = rhythm0_n
+
+    if pulses % 2 == 1:
+        rhythm0_k = int(pulses/2)
+        rhythm1_k = rhythm0_k+1
+    else:
+        rhythm0_k = int(pulses/2)
+        rhythm1_k = rhythm0_k
+
+    r_0 = exponential_rhythm(rhythm0_n, rhythm0_k)
+    r_1 = exponential_rhythm(rhythm1_n, rhythm1_k, True)
+    return r_1+r_0
+
+
+# euclidean patterns with 2 to beats-1 pulses are directly written by set_bjorklund_pattern
+def generate_rhythm(algo_index, beats, pulses):
+    if pulses == 0:
+        return [0]*beats
+    elif pulses == 1:
+        return [1]*1+[0]*(beats-1)
+    elif beats == pulses:
+        return [1]*beats
+    elif algo_index == ALGO_EXPONENTIAL:
+        return exponential_rhythm(beats, pulses)
+    elif algo_index == ALGO_INVERTED_EXPONENTIAL:
+        return exponential_rhythm(beats, pulses, True)
+    else:
+        return symmetric_exponential_rhythm(beats, pulses)
+
+
+# generated once at boot: every algo x beats 1..MAX_BEATS x pulses 0..beats
+def build_pattern_table():
+    table = array("H", bytearray(ALGO_LEN*PATTERNS_PER_ALGO*2*2))
+    for algo_index in range(0, ALGO_LEN):
+        for beats in range(1, MAX_BEATS+1):
+            for pulses in range(0, beats+1):
+                index = pattern_index(algo_index, beats, pulses)
+                if algo_index == ALGO_EUCLIDEAN and 1 < pulses < beats:
+                    set_bjorklund_pattern(table, index, beats, pulses)
+                    continue
+                rhythm = generate_rhythm(algo_index, beats, pulses)
+                pattern_low = 0
+                pattern_high = 0
+                for step, value in enumerate(rhythm):
+                    if value:
+                        if step < PATTERN_HALF_BITS:
+                            pattern_low |= 1 << step
+                        else:
+                            pattern_high |= 1 << (step - PATTERN_HALF_BITS)
+                table[index] = pattern_low
+                table[index+1] = pattern_high
+    return table
+
+
+PATTERN_TABLE = build_pattern_table()
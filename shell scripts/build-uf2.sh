@@ -15,7 +15,7 @@ if [ -d "$LX_EUCLID_REPO_DIRECTORY" ]; then
     mkdir -p "$MICROPYTHON_RP2_MODULE_DIRECTORY"
 
     # Copy all .py files from the source directory and its subdirectories to the destination directory
-    find "$LX_EUCLID_REPO_DIRECTORY" -type f -name "*.py"  -not -path "*/.git/*" -not -path "*/tmp/*" | while read -r file; do
+    find "$LX_EUCLID_REPO_DIRECTORY" -type f -name "*.py"  -not -path "*/.git/*" -not -path "*/tmp/*" -not -path "*/tests/*" | while read -r file; do
         # Get the relative path of the file from the source directory
         relative_path="${file#$LX_EUCLID_REPO_DIRECTORY/}"
 		
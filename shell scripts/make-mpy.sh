@@ -10,7 +10,7 @@ fi
 # Check if the directory exists
 if [ -d "$LX_EUCLID_REPO_DIRECTORY" ]; then
     # Find all .py files in the directory and its subdirectories
-    find "$LX_EUCLID_REPO_DIRECTORY" -type f -name "*.py" | while read -r file; do
+    find "$LX_EUCLID_REPO_DIRECTORY" -type f -name "*.py" -not -path "*/tests/*" | while read -r file; do
         # Execute the mpy-cross command for each Python file
         ./micropython/mpy-cross/build/mpy-cross "$file" -march=armv6m
     done
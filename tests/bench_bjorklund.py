@@ -0,0 +1,33 @@
+# host side microbenchmark of set_bjorklund_pattern against the recursive version it replaced,
+# run from the repository root with: python tests/bench_bjorklund.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_rhythm_patterns import recursive_bjorklund
+from rhythmPatterns import MAX_BEATS, set_bjorklund_pattern
+
+RUNS = 200
+
+PAIRS = [(beats, pulses) for beats in range(3, MAX_BEATS+1)
+         for pulses in range(2, beats)]
+
+
+def run_recursive():
+    for beats, pulses in PAIRS:
+        recursive_bjorklund(beats, pulses)
+
+
+def run_iterative(table=[0, 0]):
+    for beats, pulses in PAIRS:
+        set_bjorklund_pattern(table, 0, beats, pulses)
+
+
+if __name__ == "__main__":
+    for name, function in (("recursive", run_recursive), ("iterative", run_iterative)):
+        best_s = min(timeit.repeat(function, number=RUNS, repeat=5)) / RUNS
+        print("{}: {:.2f} ms for {} beats/pulses pairs".format(name,
+              best_s*1000, len(PAIRS)))
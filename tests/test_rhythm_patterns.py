@@ -0,0 +1,85 @@
+# host side tests of rhythmPatterns, run from the repository root with:
+# python -m unittest discover tests
+# tests are not copied in the firmware (see shell scripts)
+import sys
+import types
+import unittest
+
+if "micropython" not in sys.modules:
+    micropython = types.ModuleType("micropython")
+    micropython.const = lambda value: value
+    sys.modules["micropython"] = micropython
+
+from rhythmPatterns import MAX_BEATS, ALGO_EUCLIDEAN, PATTERN_TABLE, pattern_index, get_pattern_step, set_bjorklund_pattern
+
+
+# recursive version used before set_bjorklund_pattern, from
+# https://github.com/brianhouse/bjorklund/tree/master
+def recursive_bjorklund(beats, pulses):
+    pattern = []
+    counts = []
+    remainders = []
+    divisor = beats - pulses
+    remainders.append(pulses)
+    level = 0
+    while True:
+        counts.append(divisor // remainders[level])
+        remainders.append(divisor % remainders[level])
+        divisor = remainders[level]
+        level = level + 1
+        if remainders[level] <= 1:
+            break
+    counts.append(divisor)
+
+    def build(level):
+        if level == -1:
+            pattern.append(0)
+        elif level == -2:
+            pattern.append(1)
+        else:
+            for _ in range(0, counts[level]):
+                build(level - 1)
+            if remainders[level] != 0:
+                build(level - 2)
+
+    build(level)
+    i = pattern.index(1)
+    pattern = pattern[i:] + pattern[0:i]
+    return pattern
+
+
+# euclidean rhythm as it was generated before the pattern table
+def reference_euclidean_rhythm(beats, pulses):
+    if pulses == 0:
+        return [0]*beats
+    elif pulses == 1:
+        return [1]*1+[0]*(beats-1)
+    elif beats == pulses:
+        return [1]*beats
+    return recursive_bjorklund(beats, pulses)
+
+
+def pattern_to_list(table, index, beats):
+    return [get_pattern_step(table[index], table[index+1], step) for step in range(0, beats)]
+
+
+class TestBjorklund(unittest.TestCase):
+
+    def test_set_bjorklund_pattern_matches_recursive(self):
+        table = [0, 0]
+        for beats in range(3, MAX_BEATS+1):
+            for pulses in range(2, beats):
+                set_bjorklund_pattern(table, 0, beats, pulses)
+                self.assertEqual(pattern_to_list(table, 0, beats), recursive_bjorklund(
+                    beats, pulses), (beats, pulses))
+
+    def test_pattern_table_euclidean(self):
+        for beats in range(1, MAX_BEATS+1):
+            for pulses in range(0, beats+1):
+                index = pattern_index(ALGO_EUCLIDEAN, beats, pulses)
+                self.assertEqual(pattern_to_list(PATTERN_TABLE, index, beats), reference_euclidean_rhythm(
+                    beats, pulses), (beats, pulses))
+
+
+if __name__ == "__main__":
+    unittest.main()